@@ -1,135 +1,263 @@
 import streamlit as st
-import tempfile
 import os
+import time
+import threading
+import traceback
 from pathlib import Path
-import pandas as pd
-import json
-from datetime import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-
-def create_bar_chart(filename, title="Conversion par date", date_format="%d-%m-%Y"):
-    with open(filename, 'r', encoding='utf-8') as f:
-        data_json = json.load(f)
-    
-    if not data_json:
-        raise ValueError("Le fichier JSON est vide ou ne contient pas de données valides")
-    
-    # Conversion des clés string en objets datetime et extraction des valeurs
-    dates = []
-    values = []
-    total = 0    
-    for date_str, value in data_json.items():
-        try:
-            # Convertir la chaîne de caractères en objet datetime
-            date_obj = datetime.strptime(date_str, date_format)
-            dates.append(date_obj)
-            values.append(int(value))  # S'assurer que la valeur est un entier
-            total+=int(value)
-        except ValueError as e:
-            continue
-    
-    # Vérification qu'il reste des données après le traitement
-    if not dates:
-        raise ValueError("Aucune date valide trouvée dans le fichier")
-    
-    # Trier les données par date
-    sorted_data = sorted(zip(dates, values))
-    dates, values = zip(*sorted_data)
-    
-    # Création du graphique
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    # Graphique en barres
-    bars = ax.bar(dates, values, alpha=0.7, color='skyblue', edgecolor='navy', linewidth=1)
-    
-    # Personnalisation du graphique
-    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
-    ax.set_xlabel('Date', fontsize=12)
-    #ax.set_ylabel('Valeurs', fontsize=12)
-    ax.set_facecolor('#f0f2f6')
-    fig.patch.set_facecolor('#f0f2f6')  
-    # Rotation des étiquettes de dates pour une meilleure lisibilité
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-    
-    # Grille pour améliorer la lisibilité
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d-%m-%Y'))
-    ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(10, len(dates)//10)))
-    
-    # Rotation des étiquettes de dates pour une meilleure lisibilité
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-    ax.grid(True, alpha=0.3, axis='y', linestyle='--')
-    
-    # Ajout des valeurs au-dessus des barres
-    for bar, value in zip(bars, values):
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height + max(values)*0.01,
-               f'{value}', ha='center', va='bottom', fontsize=10)
-    
-    # Ajustement automatique de la mise en page
-    plt.tight_layout()
-    
-    return fig, total
+import archive
+import artefacts
+import metriques
+import travaux
+
+# Page de connexion servie sans la pile de conversion (pandas, PyMuPDF, openpyxl) : elle est
+# chargée à la demande, ou en tâche de fond par prechauffage() dès la première page servie.
+PRECHAUFFAGE = os.environ.get("PVFDS_PRECHAUFFAGE", "1") != "0"
+
+# Formats en colonnes proposés au téléchargement (voir convertitPV2.FORMATS_COLONNES) : libellé, type MIME
+FORMATS_COLONNES = {"parquet": ("Parquet", "application/vnd.apache.parquet"),
+                    "arrow": ("Arrow", "application/vnd.apache.arrow.file"),
+                    "csv": ("CSV", "text/csv")}
 
-def incrementer(chemin_fichier):
-    date_aujourd_hui = datetime.now().strftime("%d-%m-%Y")
-    data = {}
-    if os.path.exists(chemin_fichier):
+# Fichiers d'un résultat dans le magasin (voir artefacts.py) : la table Arrow typée tient lieu de
+# DataFrame (aucun pickle n'est relu depuis le disque)
+COMPLET, SIMPLE, ARROW = "complet.xlsx", "simple.xlsx", "donnees.arrow"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+@st.cache_resource(show_spinner=False)
+def prechauffage():
+    """
+    Une fois par serveur : importe le convertisseur et démarre son pool dans un thread, sans
+    retarder la page en cours. La première conversion trouve alors tout prêt.
+    """
+    def charger():
         try:
-            with open(chemin_fichier, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            # Erreur lors de la lecture du fichier {chemin_fichier}, création d'un nouveau dictionnaire
-            data = {}
-    
-    # Ajouter +1 à la date du jour (ou initialiser à 1 si elle n'existe pas)
-    if date_aujourd_hui in data:
-        data[date_aujourd_hui] += 1
-    else:
-        data[date_aujourd_hui] = 1
-    
-    # Sauvegarder le fichier
-    try:
-        with open(chemin_fichier, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        pass
-        
+            import convertitPV2
+            convertitPV2.prechauffer()
+        except Exception as e:
+            print(f"⚠ Préchauffage du convertisseur impossible : {e}")
+    thread = threading.Thread(target=charger, daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def donnees_barre_laterale(version, dossier=None):
+    """
+    Conversions par jour (DataFrame pour st.bar_chart), total et latences p50/p95, relus dans
+    les métriques seulement quand `version` change, c'est-à-dire après une nouvelle conversion.
+    """
+    import pandas as pd
+    par_jour = metriques.par_jour(dossier)
+    donnees = pd.DataFrame({"Date": list(par_jour), "Conversions": list(par_jour.values())})
+    return donnees, sum(par_jour.values()), metriques.latences(dossier)
+
 # Configuration de la page en mode wide pour utiliser toute la largeur
-def convert_file(file_path, original_filename):
+def convert_file(pdf_data, original_filename, session=None, progress_queue=None, annulation=None):
     """
-    Fonction de conversion du fichier PDF
+    Fonction de conversion du fichier PDF : la table Arrow des étudiants et les deux classeurs
+    Excel sont déposés dans le magasin des résultats, dont l'identifiant est renvoyé. Si l'archive est
+    activée, le PV y est ajouté sous le libellé `session`
     """
     try:
         # Importer la fonction de conversion
         from convertitPV2 import convertit as convert_pdf_to_excel
         
-        # Créer le nom du fichier de sortie basé sur le nom original
-        original_name = Path(original_filename).stem
-        output_path = str(Path(file_path).parent / f"{original_name}.xlsx")
-        output_path_simple = str(Path(file_path).parent / f"{original_name}-simple.xlsx")
-        
         # Appeler la fonction de conversion
-        df=convert_pdf_to_excel(file_path)
-        
-        # Vérifier si le fichier de sortie existe et le renommer si nécessaire
-        default_output = str(Path(file_path).with_suffix('.xlsx'))
-        default_output_simple = str(Path(file_path).with_stem(Path(file_path).stem + '-simple').with_suffix('.xlsx'))
-        if os.path.exists(default_output) and default_output != output_path:
-            os.rename(default_output, output_path)
-        if os.path.exists(default_output_simple) and default_output_simple != output_path_simple:
-            os.rename(default_output_simple, output_path_simple)
-        
-        return True, "Conversion réussie !", output_path, output_path_simple, df
+        df, excel_data, excel_data_simple, colonnes = convert_pdf_to_excel(
+            pdf_data, progress_queue, annulation=annulation, session=session, nom_pdf=original_filename,
+            formats=("arrow",))
+
+        # La session ne gardera que l'identifiant du résultat ; la table Arrow sert la vue paginée
+        identifiant = artefacts.obtenir_magasin().deposer(
+            {COMPLET: excel_data.getvalue(), SIMPLE: excel_data_simple.getvalue(), ARROW: colonnes["arrow"]},
+            fichier=original_filename)
+        return True, "Conversion réussie !", identifiant
         
     except ImportError:
-        return False, "Erreur : Le module 'convertitPV2' n'est pas disponible. Assurez-vous qu'il est dans le même répertoire.", None, None
+        return False, "Erreur : Le module 'convertitPV2' n'est pas disponible. Assurez-vous qu'il est dans le même répertoire.", None
     except Exception as e:
         error_msg = f"Erreur lors de la conversion : {str(e)}"
         # Ajouter plus de détails sur l'erreur si nécessaire
         if hasattr(e, '__traceback__'):
             error_msg += f"\nDétails : {traceback.format_exc()}"
-        return False, error_msg, None, None
+        return False, error_msg, None
+
+# Vue du résultat : lignes par page proposées
+TAILLES_PAGE = (50, 100, 250, 500)
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def table_resultat(identifiant):
+    """
+    Table Arrow typée d'un résultat (convertitPV2.table_etudiants), projetée en mémoire depuis
+    le magasin : partagée par les réexécutions et les sessions, sans copie ni désérialisation.
+    """
+    import pyarrow as pa
+    chemin = artefacts.obtenir_magasin().chemin(identifiant, ARROW)
+    if chemin is None:
+        return None
+    return pa.ipc.open_file(pa.memory_map(chemin)).read_all()
+
+def vue(table, categories=None):
+    """
+    DataFrame affiché pour des lignes d'une table typée : indexé par numéro, entêtes réduites au
+    code, une colonne de texte par UE (des `categories` choisies) avec la note ou le code lu.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from convertitPV2 import categorie_ue, NUMERO, STATUT
+    noms, colonnes = [], []
+    for nom in table.column_names:
+        if nom.endswith(STATUT):
+            continue
+        if nom + STATUT in table.column_names:
+            if categories is not None and categorie_ue(nom) not in categories:
+                continue
+            colonnes.append(pc.coalesce(table[nom + STATUT].cast(pa.string()), table[nom].cast(pa.string())))
+        else:
+            colonnes.append(table[nom])
+        noms.append(nom if nom == NUMERO else nom.split()[0])
+    return pa.Table.from_arrays(colonnes, names=noms).to_pandas().set_index(NUMERO)
+
+def afficher_resultat(identifiant):
+    """
+    Vue paginée du résultat : recherche par numéro ou nom, choix des catégories d'UE affichées,
+    puis seule la page demandée est filtrée, découpée et envoyée au navigateur.
+    """
+    import pyarrow.compute as pc
+    from convertitPV2 import categorie_ue, NUMERO, STATUT
+    from releve import NOM
+    table = table_resultat(identifiant)
+    if table is None:
+        return
+
+    ues = [nom for nom in table.column_names if nom + STATUT in table.column_names]
+    categories = sorted({categorie_ue(nom) for nom in ues})
+    col1, col2, col3 = st.columns([3, 3, 1])
+    recherche = col1.text_input("🔎 Numéro ou nom", key="vue_recherche",
+                                on_change=lambda: st.session_state.update(vue_page=1)).strip()
+    choisies = col2.multiselect("Catégories d'UE", categories, default=categories, key="vue_categories",
+                                format_func=lambda c: "Autres" if c == "default" else c)
+    taille = col3.selectbox("Lignes", TAILLES_PAGE, key="vue_taille")
+
+    if recherche:
+        filtre = pc.match_substring(table[NUMERO], recherche, ignore_case=True)
+        if NOM in table.column_names:  # absente d'un PV sans étudiant
+            filtre = pc.or_(filtre, pc.match_substring(table[NOM], recherche, ignore_case=True))
+        table = table.filter(filtre)
+    nb_pages = max(-(-table.num_rows // taille), 1)
+    if st.session_state.get("vue_page", 1) > nb_pages:
+        st.session_state["vue_page"] = 1
+    page = table.slice((st.session_state.get("vue_page", 1) - 1) * taille, taille)
+
+    st.dataframe(vue(page, choisies))
+
+    col1, col2 = st.columns([1, 3])
+    col1.number_input("Page", min_value=1, max_value=nb_pages, step=1, key="vue_page")
+    col2.caption(f"{table.num_rows} étudiants — page {st.session_state.get('vue_page', 1)}/{nb_pages}")
+
+def afficher_archive():
+    """
+    Recherche dans l'archive des PV (archive.py) : parcours d'un étudiant dans toutes les
+    sessions, ou notes d'une UE, lus dans la base sans reconvertir les PDF.
+    """
+    with st.expander("🗄️ Archive des PV"):
+        col1, col2, col3 = st.columns(3)
+        numero = col1.text_input("Numéro étudiant", key="archive_numero").strip()
+        ue = col2.text_input("Code d'UE", key="archive_ue").strip()
+        pvs = archive.sessions()
+        session = col3.selectbox("Session", [None] + sorted(set(pvs["Session"])), key="archive_session",
+                                 format_func=lambda s: "Toutes" if s is None else s)
+        if numero:
+            resultat = archive.etudiant(numero)
+        elif ue:
+            resultat = archive.resultats_ue(ue, session)
+        else:
+            resultat = pvs[pvs["Session"] == session] if session is not None else pvs
+        # Notes et codes dans les mêmes colonnes : affichés en texte
+        st.dataframe(resultat.astype(object).where(resultat.notna(), "").astype(str), hide_index=True)
+        st.caption(f"{len(resultat)} ligne(s) — {len(pvs)} PV archivé(s)")
+
+RESULTAT_EXPIRE = "⌛ Résultat expiré : relancez la conversion"
+
+def resultat_courant():
+    """Identifiant du résultat de la session et ses métadonnées, ou (None, None) s'il a expiré."""
+    identifiant = st.session_state.get('resultat')
+    if identifiant is None:
+        return None, None
+    meta = artefacts.obtenir_magasin().meta(identifiant)
+    if meta is None:
+        del st.session_state['resultat']
+        st.toast(RESULTAT_EXPIRE)
+        return None, None
+    return identifiant, meta
+
+def telecharger(identifiant, nom, libelle, produire=None, **options):
+    """
+    Téléchargement d'un fichier du résultat en deux temps : « Préparer » le lit depuis le magasin
+    (après l'y avoir produit par `produire` s'il n'y est pas encore), puis le bouton de
+    téléchargement l'envoie. Tant qu'il n'est pas demandé, et de nouveau une fois téléchargé,
+    aucun octet n'est lu ni confié au serveur de fichiers de Streamlit. Un résultat expiré
+    (`produire` renvoie None, ou fichier absent) est signalé comme dans resultat_courant.
+    """
+    pret = f"pret_{nom}"
+    if st.session_state.get(pret) != identifiant:
+        st.button(f"📦 Préparer {libelle}", key=f"preparer_{nom}", use_container_width=True,
+                  on_click=st.session_state.__setitem__, args=(pret, identifiant))
+        return
+    magasin = artefacts.obtenir_magasin()
+    if magasin.chemin(identifiant, nom) is None and produire is not None:
+        octets = produire()
+        if octets is not None:
+            magasin.ajouter(identifiant, nom, octets)
+    chemin = magasin.chemin(identifiant, nom)
+    if chemin is None:
+        st.session_state.pop(pret, None)
+        st.toast(RESULTAT_EXPIRE)
+        return
+    with open(chemin, 'rb') as f:
+        octets = f.read()
+    st.download_button(f"📥 Télécharger {libelle}", octets, key=f"telecharger_{nom}", use_container_width=True,
+                       on_click=lambda: st.session_state.pop(pret, None), **options)
+
+def demandeur():
+    """Identifiant de la session Streamlit, pour le tour de rôle de la file des conversions."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def suivre_conversion(identifiant, zone_apercu):
+    """
+    Suit une conversion de la file (travaux.py) jusqu'à sa fin : rang dans la file, puis barre
+    de progression dans la sidebar et tableau partiel dans la zone principale. La conversion ne
+    dépend pas de la session : après un rerun, elle est reprise par son identifiant.
+    Renvoie le travail fini, ou None s'il n'existe plus.
+    """
+    from releve import fusionner
+    from convertitPV2 import table_etudiants
+    file = travaux.obtenir_file()
+    if st.button("✖ Annuler la conversion", use_container_width=True):
+        file.annuler(identifiant)
+
+    barre = st.progress(0.0, text="🔄 Conversion en cours... Veuillez patienter.")
+    apercu = zone_apercu.empty()
+    affiches = 0
+    while True:
+        travail = file.suivre(identifiant)
+        if travail is None or travail.fini:
+            break
+        if travail.statut == travaux.EN_ATTENTE:
+            barre.progress(0.0, text=f"⏳ En attente — {file.position(identifiant)} conversion(s) avant la vôtre")
+        elif len(travail.releves) > affiches:
+            # Relevés reçus dans l'ordre d'arrivée des plages, fusionnés pour l'aperçu
+            affiches = len(travail.releves)
+            partiel = fusionner(travail.releves[:affiches])
+            barre.progress(travail.pages_traitees / max(travail.nb_pages, 1),
+                           text=f"🔄 Page {travail.pages_traitees}/{travail.nb_pages} — {len(partiel)} étudiants")
+            if len(partiel):
+                apercu.dataframe(vue(table_etudiants(partiel)))
+        time.sleep(0.2)
+    barre.empty()
+    apercu.empty()
+    return travail
 
 def check_credentials():
     """Vérifie les identifiants utilisateur"""
@@ -488,6 +616,9 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    # Emplacement de l'aperçu en cours de conversion, dans la zone principale
+    zone_apercu = st.container()
+
     # Sidebar pour la sélection et téléchargement
     with st.sidebar:
         # Bouton de déconnexion en haut de la sidebar
@@ -496,7 +627,9 @@ def main():
             st.session_state["authenticated"] = False
             if "current_user" in st.session_state:
                 del st.session_state["current_user"]
-            # Nettoyer les autres données de session
+            # Nettoyer les autres données de session, et le résultat déposé dans le magasin
+            if 'resultat' in st.session_state:
+                artefacts.obtenir_magasin().supprimer(st.session_state['resultat'])
             for key in list(st.session_state.keys()):
                 if key not in ["authenticated", "current_user"]:
                     del st.session_state[key]
@@ -526,97 +659,93 @@ def main():
             #**{uploaded_file.name}**  
             #**Taille :** {uploaded_file.size / 1024:.1f} KB""")
             
-            # Bouton de conversion
-            if st.button("🚀 Convertir le fichier", type="primary", use_container_width=True):
-                # Créer un fichier temporaire
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    tmp_file_path = tmp_file.name
+            # Libellé de session du PV dans l'archive (nom du fichier par défaut)
+            session = None
+            if archive.ARCHIVE:
+                session = st.text_input("Session (archive)", placeholder=Path(uploaded_file.name).stem).strip() or None
+
+            # Bouton de conversion : la conversion est confiée à la file partagée
+            if st.button("🚀 Convertir le fichier", type="primary", use_container_width=True,
+                         disabled='travail' in st.session_state):
+                st.session_state['travail'] = travaux.obtenir_file().soumettre(
+                    demandeur(), convert_file, uploaded_file.getvalue(), uploaded_file.name, session)
+                st.session_state['travail_fichier'] = uploaded_file.name
+
+        # Suivi de la conversion en cours, y compris après un rerun
+        if 'travail' in st.session_state:
+            travail = suivre_conversion(st.session_state['travail'], zone_apercu)
+            travaux.obtenir_file().retirer(st.session_state.pop('travail'))
+            nom_fichier = st.session_state.pop('travail_fichier')
+            if travail is None or travail.statut == travaux.ANNULE:
+                st.toast("✖ Conversion annulée")
+            elif travail.statut == travaux.ERREUR:
+                st.toast("❌ Erreur de conversion")
+            else:
+                success, message, identifiant = travail.resultat
                 
-                try:
-                    # Afficher le message de progression
-                    with st.spinner("🔄 Conversion en cours... Veuillez patienter."):
-                        # Appeler la fonction de conversion
-                        success, message, output_path, output_path_simple, df = convert_file(tmp_file_path, uploaded_file.name)
+                if success:
+                    # Afficher le message de succès
+                    st.balloons()
+                    st.toast("✅ Conversion réussie !")
                     
-                    if success and output_path and output_path_simple and os.path.exists(output_path) and os.path.exists(output_path_simple):
-                        # Afficher le message de succès
-                        st.balloons()
-                        incrementer("metrics.json")
-                        st.toast("✅ Conversion réussie !")
-                        
-                        # Stocker le dataframe pour l'affichage dans la zone principale
-                        st.session_state['df_display'] = df.rename(columns={col: col.split()[0] for col in df.columns})
-                        st.session_state['excel_data'] = None
-                        st.session_state['download_filename'] = f"{Path(uploaded_file.name).stem}.xlsx"
-                        st.session_state['download_filename_simple'] = f"{Path(uploaded_file.name).stem}-simple.xlsx"
-                        
-                        # Lire le fichier converti pour le téléchargement
-                        with open(output_path, 'rb') as file:
-                            excel_data = file.read()
-                            st.session_state['excel_data'] = excel_data
-                        with open(output_path_simple, 'rb') as file:
-                            excel_data_simple = file.read()
-                            st.session_state['excel_data_simple'] = excel_data_simple
-                        
-                        st.toast(f"📁 **Fichiers prêts :** {st.session_state['download_filename']} et {st.session_state['download_filename_simple']}")
-                        
-                        # Nettoyer le fichier de sortie
-                        try:
-                            os.unlink(output_path)
-                            os.unlink(output_path_simple)
-                        except:
-                            pass
-                            
-                    elif success:
-                        # Cas où la conversion réussit mais le fichier n'est pas trouvé
-                        st.toast(f"""✅ Conversion terminée !""")
-                    else:
-                        # Afficher le message d'erreur
-                        st.toast(f"""❌ Erreur de conversion""")
-                        
-                finally:
-                    # Nettoyer le fichier temporaire
-                    try:
-                        os.unlink(tmp_file_path)
-                    except:
-                        pass
+                    # Le résultat reste dans le magasin : la session n'en garde que l'identifiant
+                    if 'resultat' in st.session_state:
+                        artefacts.obtenir_magasin().supprimer(st.session_state['resultat'])
+                    st.session_state['resultat'] = identifiant
+                    for cle in ("vue_recherche", "vue_categories", "vue_page"):
+                        st.session_state.pop(cle, None)
+                    
+                    st.toast(f"📁 **Fichiers prêts :** {Path(nom_fichier).stem}.xlsx et {Path(nom_fichier).stem}-simple.xlsx")
+                else:
+                    # Afficher le message d'erreur
+                    st.toast(f"""❌ Erreur de conversion""")
         
-        # Bouton de téléchargement (affiché seulement si des données Excel sont disponibles)
-        if 'excel_data' in st.session_state and 'excel_data_simple' in st.session_state and st.session_state['excel_data'] is not None and st.session_state['excel_data_simple'] is not None:
+        # Boutons de téléchargement (affichés seulement si un résultat est disponible)
+        resultat, meta = resultat_courant()
+        if resultat is not None:
+            base = Path(meta["fichier"]).stem
             st.markdown("---")
-            st.download_button(
-                label="📥 Télécharger le fichier Excel",
-                data=st.session_state['excel_data'],
-                file_name=st.session_state['download_filename'],
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                type="primary",
-                use_container_width=True
-            )
-            st.download_button(
-                label="📥 Télécharger le fichier Excel simplifié",
-                data=st.session_state['excel_data_simple'],
-                file_name=st.session_state['download_filename_simple'],
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                type="primary",
-                use_container_width=True
-            )
+            telecharger(resultat, COMPLET, "le fichier Excel",
+                        file_name=f"{base}.xlsx", mime=XLSX, type="primary")
+            telecharger(resultat, SIMPLE, "le fichier Excel simplifié",
+                        file_name=f"{base}-simple.xlsx", mime=XLSX, type="primary")
+
+            # Données en colonnes pour les traitements en aval, produites à la première préparation du format
+            format_colonnes = st.selectbox("Format des données", list(FORMATS_COLONNES),
+                                           format_func=lambda f: FORMATS_COLONNES[f][0])
+
+            def produire():
+                from convertitPV2 import table_octets
+                table = table_resultat(resultat)
+                if table is None:
+                    return None
+                return table_octets(table, (format_colonnes,))[format_colonnes]
+            telecharger(resultat, f"donnees.{format_colonnes}", f"les données ({FORMATS_COLONNES[format_colonnes][0]})",
+                        produire, file_name=f"{base}.{format_colonnes}", mime=FORMATS_COLONNES[format_colonnes][1])
         
         # Footer dans la sidebar
-        fig, total=create_bar_chart("metrics.json")
+        donnees, total, (p50, p95) = donnees_barre_laterale(metriques.version(), metriques.METRIQUES_DIR)
+        latence = f"<br>p50 {p50:.1f} s · p95 {p95:.1f} s" if p50 is not None else ""
         
         st.markdown(f"""
         <div class="footer">
             <p>© Vincent Boudet</p>
-            {total} PVs convertis
+            {total} PVs convertis{latence}
         </div>
         """, unsafe_allow_html=True)
-        st.pyplot(fig)
+        if len(donnees):
+            # Histogramme rendu par le navigateur (Vega-Lite), sans figure Matplotlib à rastériser
+            st.caption("Conversion par date")
+            st.bar_chart(donnees, x="Date", y="Conversions", height=220)
+    # Archive des PV convertis, si elle est activée
+    if archive.ARCHIVE:
+        afficher_archive()
+
     # Zone principale pour l'affichage du dataframe - prend toute la largeur
-    if 'df_display' in st.session_state and st.session_state['df_display'] is not None:
+    if 'resultat' in st.session_state:
         
-        # Affichage du dataframe avec toute la largeur disponible
-        st.dataframe(st.session_state['df_display'])
+        # Vue paginée du résultat, avec toute la largeur disponible
+        afficher_resultat(st.session_state['resultat'])
     else:
         # Message d'accueil dans la zone principale
         st.markdown("""
@@ -637,3 +766,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    if PRECHAUFFAGE:
+        prechauffage()
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+# Archive locale des PV convertis (facultative) : chemin de la base SQLite, vide pour ne rien archiver
+ARCHIVE = os.environ.get("PVFDS_ARCHIVE", "")
+ATTENTE = 30                         # secondes d'attente d'un verrou d'écriture
+
+# Tables rangées (WITHOUT ROWID) dans l'ordre des recherches par UE : les notes d'une UE sont
+# contiguës, PV par PV, et les noms lus dans l'ordre ; index par numéro pour le parcours d'un étudiant
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pv (
+    id INTEGER PRIMARY KEY,
+    empreinte TEXT NOT NULL UNIQUE,
+    session TEXT NOT NULL,
+    fichier TEXT NOT NULL,
+    date REAL NOT NULL,
+    etudiants INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pv_session ON pv (session);
+CREATE TABLE IF NOT EXISTS etudiants (
+    pv INTEGER NOT NULL,
+    numero TEXT NOT NULL,
+    nom TEXT,
+    PRIMARY KEY (pv, numero)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS etudiants_numero ON etudiants (numero);
+CREATE TABLE IF NOT EXISTS notes (
+    ue TEXT NOT NULL,
+    pv INTEGER NOT NULL,
+    numero TEXT NOT NULL,
+    note REAL,
+    statut TEXT,
+    PRIMARY KEY (ue, pv, numero)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS notes_numero ON notes (numero, pv)
+"""
+
+def _connexion(chemin):
+    """Connexion à l'archive, créée au besoin ; mode WAL pour lire pendant qu'une conversion écrit."""
+    connexion = sqlite3.connect(chemin, timeout=ATTENTE, isolation_level=None)
+    connexion.execute("PRAGMA journal_mode=WAL")
+    if connexion.execute("SELECT name FROM sqlite_master WHERE name = 'notes'").fetchone() is None:
+        connexion.execute("BEGIN IMMEDIATE")
+        try:
+            for instruction in SCHEMA.split(";"):
+                connexion.execute(instruction)
+            connexion.execute("COMMIT")
+        except BaseException:
+            connexion.execute("ROLLBACK")
+            connexion.close()
+            raise
+    return connexion
+
+def code_ue(colonne):
+    """Code d'une colonne du DataFrame (premier mot de l'entête : code d'UE, Moyenne, Résultat)."""
+    mots = str(colonne).split()
+    return mots[0] if mots else str(colonne)
+
+def codes_ue(colonnes):
+    """
+    Code archivé de chaque colonne d'un PV : son code_ue, ou l'entête entière (espaces réduits)
+    si une colonne précédente du PV a déjà pris ce code, numérotée au besoin. Deux colonnes
+    d'un même PV n'ont jamais le même code : aucune n'écrase les notes d'une autre.
+    """
+    codes = []
+    for colonne in colonnes:
+        code = code_ue(colonne)
+        if code in codes:
+            code = " ".join(str(colonne).split()) or str(colonne)
+        base, k = code, 2
+        while code in codes:
+            code, k = f"{base} ({k})", k + 1
+        codes.append(code)
+    return codes
+
+def _lignes_notes(releve, pv):
+    """(numéro, UE, pv, note, statut) de chaque case lue : note réelle ou code (AB, ADM, "" case vide)."""
+    from releve import NOTE
+    lignes = []
+    reels = releve.reels()
+    for j, ue in enumerate(codes_ue(releve.colonnes)):
+        for numero, note, code in zip(releve.numeros, reels[:, j].tolist(), releve.codes[:, j].tolist()):
+            if code > NOTE:
+                lignes.append((numero, ue, pv, None, releve.categories[code]))
+            elif code == NOTE and note == note:  # case absente : UE non suivie
+                lignes.append((numero, ue, pv, note, None))
+    return lignes
+
+def archiver(cle, releve, session, fichier="", chemin=None):
+    """
+    Archive les étudiants et les notes du relevé (releve.Releve) d'un PV d'empreinte `cle`, sous
+    le libellé `session`.
+    Un PV déjà archivé (même empreinte) n'est pas réécrit. Renvoie True s'il a été ajouté,
+    False s'il l'était déjà ; None pour un PV sans étudiant, qui n'est pas archivé (il
+    bloquerait une conversion correcte du même PDF), ou pour une erreur, signalée sans
+    interrompre la conversion.
+    """
+    if len(releve) == 0:
+        print(f"⚠ PV sans étudiant non archivé : {fichier or cle[:12]}")
+        return None
+    try:
+        connexion = _connexion(chemin or ARCHIVE)
+        try:
+            if connexion.execute("SELECT 1 FROM pv WHERE empreinte = ?", (cle,)).fetchone() is not None:
+                return False
+            connexion.execute("BEGIN IMMEDIATE")
+            try:
+                curseur = connexion.execute(
+                    "INSERT INTO pv (empreinte, session, fichier, date, etudiants) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (empreinte) DO NOTHING", (cle, session, fichier, time.time(), len(releve)))
+                if curseur.rowcount == 0:  # archivé entre-temps par une autre conversion
+                    connexion.execute("ROLLBACK")
+                    return False
+                pv = curseur.lastrowid
+                connexion.executemany("INSERT INTO etudiants (numero, pv, nom) VALUES (?, ?, ?)",
+                                      [(numero, pv, nom) for numero, nom in zip(releve.numeros, releve.noms)])
+                connexion.executemany("INSERT INTO notes (numero, ue, pv, note, statut) VALUES (?, ?, ?, ?, ?)",
+                                      _lignes_notes(releve, pv))
+                connexion.execute("COMMIT")
+            except BaseException:
+                connexion.execute("ROLLBACK")
+                raise
+        finally:
+            connexion.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ Archive indisponible : {e}")
+        return None
+    return True
+
+def _lire(requete, parametres, chemin):
+    """Lignes d'une requête sur l'archive ([] et un avertissement si elle est indisponible)."""
+    try:
+        connexion = _connexion(chemin or ARCHIVE)
+        try:
+            return connexion.execute(requete, parametres).fetchall()
+        finally:
+            connexion.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ Archive indisponible : {e}")
+        return []
+
+def etudiant(numero, chemin=None):
+    """
+    Parcours d'un étudiant dans l'archive : une ligne par PV (session, fichier, nom, moyenne,
+    résultat), puis une colonne par UE avec la note ou le code lu, dans l'ordre des sessions.
+    """
+    import pandas as pd
+    from releve import MOYENNE, RESULTAT
+    lignes = _lire("SELECT pv.id, pv.session, pv.fichier, e.nom, n.ue, n.note, n.statut "
+                   "FROM etudiants e JOIN pv ON pv.id = e.pv LEFT JOIN notes n ON n.numero = e.numero AND n.pv = e.pv "
+                   "WHERE e.numero = ? ORDER BY pv.session, pv.id", (str(numero),), chemin)
+    parcours, ues = {}, {}
+    for pv, session, fichier, nom, ue, note, statut in lignes:
+        ligne = parcours.setdefault(pv, {"Session": session, "Fichier": fichier, "Nom": nom})
+        if ue is not None:
+            ligne[ue] = statut if note is None else note
+            ues[ue] = None
+    entetes = [code for code in (MOYENNE, RESULTAT) if code in ues] + sorted(set(ues) - {MOYENNE, RESULTAT})
+    return pd.DataFrame(list(parcours.values()), columns=["Session", "Fichier", "Nom"] + entetes)
+
+def resultats_ue(ue, session=None, chemin=None):
+    """Notes (ou codes) d'une UE, pour une session ou toutes : une ligne par étudiant et par PV."""
+    import pandas as pd
+    colonnes = "SELECT pv.session, n.numero, e.nom, n.note, n.statut "
+    noms = "LEFT JOIN etudiants e ON e.pv = n.pv AND e.numero = n.numero "
+    if session is None:
+        requete, parametres = colonnes + "FROM notes n JOIN pv ON pv.id = n.pv " + noms + "WHERE n.ue = ?", (ue,)
+    else:
+        # Les PV de la session d'abord (CROSS JOIN fixe l'ordre) : seules leurs notes sont lues
+        requete = colonnes + "FROM pv CROSS JOIN notes n ON n.ue = ? AND n.pv = pv.id " + noms + "WHERE pv.session = ?"
+        parametres = (ue, session)
+    # Lignes dans l'ordre de la table (sans tri par SQLite), classées par session ensuite
+    lignes = _lire(requete + " ORDER BY n.pv, n.numero", parametres, chemin)
+    resultat = pd.DataFrame([(session, numero, nom, statut if note is None else note)
+                             for session, numero, nom, note, statut in lignes],
+                            columns=["Session", "Numéro", "Nom", ue])
+    return resultat.sort_values("Session", kind="stable", ignore_index=True)
+
+def sessions(chemin=None):
+    """PV archivés : session, fichier, date d'archivage et nombre d'étudiants."""
+    import pandas as pd
+    lignes = _lire("SELECT session, fichier, datetime(date, 'unixepoch', 'localtime'), etudiants, empreinte "
+                   "FROM pv ORDER BY session, id", (), chemin)
+    return pd.DataFrame(lignes, columns=["Session", "Fichier", "Archivé le", "Étudiants", "Empreinte"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="archive", description="Interroge l'archive des PV convertis.")
+    parser.add_argument("--base", default=ARCHIVE, help="base SQLite de l'archive (défaut : $PVFDS_ARCHIVE)")
+    commandes = parser.add_subparsers(dest="commande", required=True)
+    commandes.add_parser("sessions", help="PV archivés")
+    commande = commandes.add_parser("etudiant", help="notes d'un étudiant dans toutes les sessions")
+    commande.add_argument("numero")
+    commande = commandes.add_parser("ue", help="notes d'une UE")
+    commande.add_argument("code")
+    commande.add_argument("--session", default=None, help="une seule session")
+    args = parser.parse_args()
+
+    if not args.base:
+        sys.exit("Aucune archive : indiquez --base ou PVFDS_ARCHIVE")
+    if not os.path.exists(args.base):
+        sys.exit(f"Archive introuvable : {args.base}")
+    if args.commande == "sessions":
+        resultat = sessions(args.base)
+    elif args.commande == "etudiant":
+        resultat = etudiant(args.numero, args.base)
+    else:
+        resultat = resultats_ue(args.code, args.session, args.base)
+    print(resultat.to_string(index=False) if len(resultat) else "Aucun résultat")
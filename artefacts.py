@@ -0,0 +1,149 @@
+import os
+import json
+import stat
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+
+# Résultats des conversions de l'application, gardés sur disque : les sessions n'en gardent que
+# l'identifiant, et les téléchargements sont lus depuis le magasin. Le magasin est un dossier
+# privé du dossier de cache des conversions (voir convertitPV2.CACHE_DIR).
+CACHE_DIR = os.environ.get("PVFDS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pvfds"))
+ARTEFACTS_DIR = os.environ.get("PVFDS_ARTEFACTS_DIR", os.path.join(CACHE_DIR, "artefacts"))
+DUREE = float(os.environ.get("PVFDS_ARTEFACTS_DUREE", 3600))                          # s depuis le dernier accès
+TAILLE_MAX = int(os.environ.get("PVFDS_ARTEFACTS_TAILLE_MAX", 200 * 1024 * 1024))   # en octets
+META = "meta.json"
+
+class Magasin:
+    """
+    Magasin des résultats : un dossier par résultat (fichiers nommés, plus META), identifié par
+    un identifiant aléatoire. Un résultat non lu depuis `duree` secondes expire ; au-delà de
+    `taille_max` octets, les moins récemment lus sont supprimés en premier.
+    """
+
+    def __init__(self, dossier=ARTEFACTS_DIR, duree=DUREE, taille_max=TAILLE_MAX):
+        self.dossier = dossier
+        self.duree = duree
+        self.taille_max = taille_max
+        self._verrou = threading.Lock()
+        dossier_prive(dossier)
+        self.purger()
+
+    def deposer(self, fichiers, **meta):
+        """Enregistre les fichiers {nom: octets} d'un résultat et renvoie son identifiant."""
+        identifiant = uuid.uuid4().hex
+        # Écriture dans un dossier temporaire puis renommage, pour ne jamais exposer un résultat incomplet
+        tmp = tempfile.mkdtemp(dir=self.dossier, prefix=".tmp-")
+        for nom, octets in fichiers.items():
+            with open(os.path.join(tmp, nom), 'wb') as f:
+                f.write(octets)
+        with open(os.path.join(tmp, META), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.rename(tmp, os.path.join(self.dossier, identifiant))
+        self.purger()
+        return identifiant
+
+    def ajouter(self, identifiant, nom, octets):
+        """Ajoute un fichier à un résultat existant (produit après coup) ; False s'il a expiré."""
+        entree = self._entree(identifiant)
+        if entree is None:
+            return False
+        fd, tmp = tempfile.mkstemp(dir=entree, prefix=".tmp-")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(octets)
+        os.replace(tmp, os.path.join(entree, nom))
+        return True
+
+    def chemin(self, identifiant, nom):
+        """Chemin d'un fichier du résultat, ou None si le résultat a expiré ou n'a pas ce fichier."""
+        entree = self._entree(identifiant)
+        if entree is None or not os.path.exists(os.path.join(entree, nom)):
+            return None
+        return os.path.join(entree, nom)
+
+    def meta(self, identifiant):
+        """Métadonnées données au dépôt, ou None si le résultat a expiré."""
+        chemin = self.chemin(identifiant, META)
+        if chemin is None:
+            return None
+        with open(chemin, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def supprimer(self, identifiant):
+        """Supprime un résultat dont la session n'a plus besoin."""
+        if _identifiant_valide(identifiant):
+            shutil.rmtree(os.path.join(self.dossier, identifiant), ignore_errors=True)
+
+    def _entree(self, identifiant):
+        """Dossier du résultat, marqué comme lu (LRU), ou None s'il n'existe plus ou a expiré."""
+        if not _identifiant_valide(identifiant):
+            return None
+        entree = os.path.join(self.dossier, identifiant)
+        try:
+            if time.time() - os.path.getmtime(entree) > self.duree:
+                shutil.rmtree(entree, ignore_errors=True)
+                return None
+            os.utime(entree)
+        except OSError:
+            return None
+        return entree
+
+    def purger(self):
+        """Supprime les résultats expirés, puis les moins récemment lus au-delà de taille_max."""
+        with self._verrou:
+            maintenant = time.time()
+            entrees = []
+            for nom in os.listdir(self.dossier):
+                chemin = os.path.join(self.dossier, nom)
+                try:
+                    date = os.path.getmtime(chemin)
+                    if nom.startswith(".tmp-"):
+                        # Dépôt interrompu (arrêt du serveur) : on le laisse à un dépôt en cours
+                        if maintenant - date > self.duree:
+                            shutil.rmtree(chemin, ignore_errors=True)
+                        continue
+                    if maintenant - date > self.duree:
+                        shutil.rmtree(chemin, ignore_errors=True)
+                        continue
+                    taille = sum(os.path.getsize(os.path.join(chemin, f)) for f in os.listdir(chemin))
+                except OSError:
+                    continue
+                entrees.append((date, taille, chemin))
+
+            total = sum(taille for _, taille, _ in entrees)
+            for _, taille, chemin in sorted(entrees):
+                if total <= self.taille_max:
+                    break
+                shutil.rmtree(chemin, ignore_errors=True)
+                total -= taille
+
+def dossier_prive(chemin):
+    """
+    Crée au besoin un dossier réservé à l'utilisateur courant (0700) et le renvoie. Un dossier
+    existant doit être un vrai dossier lui appartenant (pas un lien posé par un autre compte) :
+    PermissionError sinon. Ses droits sont ramenés à 0700.
+    """
+    os.makedirs(chemin, mode=0o700, exist_ok=True)
+    etat = os.lstat(chemin)
+    if not stat.S_ISDIR(etat.st_mode) or (hasattr(os, "getuid") and etat.st_uid != os.getuid()):
+        raise PermissionError(f"{chemin} n'est pas un dossier de l'utilisateur courant")
+    if stat.S_IMODE(etat.st_mode) & 0o077:
+        os.chmod(chemin, 0o700)
+    return chemin
+
+def _identifiant_valide(identifiant):
+    """Vrai pour un identifiant donné par deposer (protège des chemins arbitraires)."""
+    return isinstance(identifiant, str) and len(identifiant) == 32 and all(c in "0123456789abcdef" for c in identifiant)
+
+_magasin = None
+_magasin_verrou = threading.Lock()
+
+def obtenir_magasin():
+    """Renvoie le magasin partagé, en le créant (et en le purgeant) au premier appel."""
+    global _magasin
+    with _magasin_verrou:
+        if _magasin is None:
+            _magasin = Magasin()
+        return _magasin
@@ -0,0 +1,385 @@
+import os
+import sys
+import json
+import time
+import math
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import shutil
+import atexit
+import fitz
+
+# Les conversions mesurées ne comptent pas dans les métriques de production ni dans l'archive :
+# métriques dans un dossier temporaire, archive désactivée. Fixé avant l'import de convertitPV2,
+# qui lit ces variables, et hérité par les interpréteurs neufs des mesures de démarrage.
+os.environ["PVFDS_METRIQUES_DIR"] = tempfile.mkdtemp(prefix="pvfds-benchmark-")
+os.environ["PVFDS_ARCHIVE"] = ""
+atexit.register(shutil.rmtree, os.environ["PVFDS_METRIQUES_DIR"], ignore_errors=True)
+
+import convertitPV2
+import releve
+
+# Étapes mesurées, dans l'ordre du traitement
+ETAPES = ["ouverture", "texte", "tableaux", "lecture_lignes", "merge_etudiants", "dataframe",
+          "plan_export", "export", "export_simple"]
+
+LARGEUR_CELLULE = 62
+HAUTEUR_CELLULE = 34
+MARGE = 36
+
+def _code_ue(k):
+    """Code d'UE sur 7 caractères, la lettre de catégorie en 7e position."""
+    return f"HA{'XYZ'[k % 3]}{1 + k // 30}{k % 30:02d}{'ICEPMXTLVB'[k % 10]}"
+
+def _cellule_note(rnd):
+    tirage = rnd.random()
+    if tirage < 0.06:
+        return "AB"
+    if tirage < 0.09:
+        return "ABJ"
+    if tirage < 0.12:
+        return "NACQ"
+    if tirage < 0.14:
+        return "DIS"
+    if tirage < 0.16:
+        return ""
+    return f"{rnd.choice(['ADM', 'AJ', 'CMP'])} {rnd.uniform(0, 20):.3f}\n{rnd.choice(['2024', '2025'])}"
+
+def generer_pv(chemin, etudiants=60, ues=12, pages=5, ues_par_page=12, graine=0):
+    """
+    Génère un PV synthétique semblable aux nôtres : une page de garde et une page finale
+    (ignorées par convertit), puis des pages de tableau avec une ligne par étudiant ("N°:"),
+    une colonne "Résultat", des notes et des codes AB/NACQ/DIS, et une ligne "note max" en pied.
+
+    Les UE sont réparties par groupes de `ues_par_page` colonnes : chaque bloc d'étudiants
+    occupe une page par groupe, la colonne "Résultat" n'étant que sur la première.
+    Renvoie les paramètres effectifs (dont le nombre réel de pages de tableau).
+    """
+    rnd = random.Random(graine)
+    codes = [_code_ue(k) for k in range(ues)]
+    # Quelques colonnes de blocs et de codes longs pour exercer le classeur simplifié
+    codes += [f"BLOC{k + 1}" for k in range(max(ues // 10, 1))] + [f"HAX{k:03d}IE" for k in range(max(ues // 15, 1))]
+    groupes = [codes[k:k + ues_par_page] for k in range(0, len(codes), ues_par_page)] or [[]]
+    blocs = max(pages // len(groupes), 1)
+    par_page = max(math.ceil(etudiants / blocs), 1)
+    liste = [(f"{22000000 + k}", f"NOM{k}", f"Prénom{k}") for k in range(etudiants)]
+    moyennes = {numero: rnd.uniform(4, 18) for numero, _, _ in liste}
+
+    doc = fitz.open()
+    garde = doc.new_page()
+    garde.insert_text((72, 72), "Procès-verbal de délibération - document synthétique", fontsize=14)
+
+    for debut in range(0, etudiants, par_page):
+        bloc = liste[debut:debut + par_page]
+        for g, groupe in enumerate(groupes):
+            entete = ["Étudiant"] + (["Résultat"] if g == 0 else []) + [f"{code} Intitulé de l'UE" for code in groupe]
+            lignes = [entete]
+            for numero, nom, prenom in bloc:
+                ligne = [f"N°:{numero}\n{nom} {prenom}"]
+                if g == 0:
+                    if rnd.random() < 0.03:
+                        ligne.append("AB\nAJ jury")
+                    else:
+                        ligne.append(f"Résultat {moyennes[numero]:.3f}\n{'ADM' if moyennes[numero] >= 10 else 'AJ'} jury")
+                ligne += [_cellule_note(rnd) for _ in groupe]
+                lignes.append(ligne)
+            lignes.append(["note max"] + ["20.000"] * (len(entete) - 1))
+
+            largeur = 2 * MARGE + LARGEUR_CELLULE * len(entete)
+            hauteur = 2 * MARGE + HAUTEUR_CELLULE * len(lignes)
+            page = doc.new_page(width=max(largeur, 842), height=max(hauteur, 595))
+            for r, ligne in enumerate(lignes):
+                y = MARGE + HAUTEUR_CELLULE * r
+                for c, texte in enumerate(ligne):
+                    rect = fitz.Rect(MARGE + LARGEUR_CELLULE * c, y, MARGE + LARGEUR_CELLULE * (c + 1), y + HAUTEUR_CELLULE)
+                    page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+                    if texte:
+                        page.insert_textbox(rect + (2, 2, -2, -2), texte, fontsize=6)
+
+    fin = doc.new_page()
+    fin.insert_text((72, 72), "Signatures du jury", fontsize=12)
+    doc.save(chemin)
+    nb_pages = len(doc) - 2
+    doc.close()
+    return {"etudiants": etudiants, "ues": ues, "colonnes": len(codes), "ues_par_page": ues_par_page,
+            "pages_tableau": nb_pages, "etudiants_par_page": par_page, "graine": graine}
+
+def _lecture_reference(tableaux):
+    """
+    Lecture case par case d'origine : un dictionnaire par étudiant et par tableau, fusionnés
+    dans l'ordre (dernière lecture gagnante), puis DataFrame des dictionnaires.
+    """
+    import pandas as pd
+    fusion = {}
+    for page_data in tableaux:
+        entete = page_data[0]
+        etudiants = {}
+        for ligne in page_data[1:]:
+            if ligne[0].startswith('note max'):
+                break
+            numero = ligne[0].split("\n")[0].split(":")[1]
+            etudiant = etudiants.setdefault(numero, {releve.NOM: ligne[0].split("\n")[1]})
+            for col in range(1, len(ligne)):
+                if entete[col]:
+                    note = ligne[col].split("\n")[0]
+                    if not ligne[col].startswith('Résultat'):
+                        if not note.startswith("AB") and note != "" and note != "NACQ" and note != "DIS":
+                            note = float(note.split(" ")[-1])
+                        etudiant[entete[col]] = note
+                    else:
+                        etudiant[releve.MOYENNE] = float(note.split(" ")[-1])
+                        etudiant[releve.RESULTAT] = ligne[col].split("\n")[1].split(" ")[0]
+        for numero, etudiant in etudiants.items():
+            fusion.setdefault(numero, {}).update(etudiant)
+    return pd.DataFrame.from_dict(fusion, orient='index')
+
+def _tableau_aleatoire(rnd, numeros, codes):
+    """Tableau extrait aléatoire : entêtes vides ou répétées, lignes courtes ou répétées, cases variées."""
+    entete = ["Étudiant"] + [rnd.choice(codes + [""]) for _ in range(rnd.randint(0, 8))]
+    lignes = [entete]
+    for _ in range(rnd.randint(0, 12)):
+        numero = rnd.choice(numeros)
+        ligne = [f"N°:{numero}\nNOM{numero} Prénom"]
+        for _ in range(rnd.randint(0, len(entete) - 1)):
+            tirage = rnd.random()
+            if tirage < 0.1:
+                ligne.append(f"Résultat {rnd.uniform(0, 20):.3f}\n{rnd.choice(['ADM', 'AJ', 'ADJ'])} jury")
+            elif tirage < 0.2:
+                ligne.append(f"{rnd.uniform(0, 20):.2f}")
+            else:
+                ligne.append(_cellule_note(rnd))
+        lignes.append(ligne)
+    if rnd.random() < 0.5:
+        lignes.append(["note max"] + ["20.000"] * (len(entete) - 1))
+        lignes.append([f"N°:{rnd.choice(numeros)}\nIGNORÉ"] + ["1.0"] * (len(entete) - 1))
+    return lignes
+
+def verifier_lecture(essais=1000, graine=0):
+    """
+    Compare la lecture des tableaux (lire_tableau, case par case puis en bloc, fusionner,
+    Releve.dataframe) à la lecture case par case d'origine sur des PV aléatoires de quelques
+    tableaux : mêmes étudiants, mêmes colonnes dans le même ordre, mêmes notes et codes. Renvoie
+    le nombre de PV en écart.
+    """
+    rnd = random.Random(graine)
+    codes = [_code_ue(k) for k in range(6)] + [releve.MOYENNE, releve.RESULTAT]
+    regles = dict.fromkeys(releve.REGLES, "derniere")
+    ecarts = 0
+    for essai in range(essais):
+        numeros = [str(22000000 + k) for k in range(rnd.randint(1, 6))]
+        tableaux = [_tableau_aleatoire(rnd, numeros, codes) for _ in range(rnd.randint(1, 4))]
+        attendu = _lecture_reference(tableaux)
+        for seuil, lecture in ((float("inf"), "case par case"), (0, "en bloc")):
+            obtenu = releve.fusionner([releve.lire_tableau(t, seuil) for t in tableaux], regles).dataframe()
+            identiques = (list(attendu.index) == list(obtenu.index) and list(attendu.columns) == list(obtenu.columns)
+                          and all(a == b or (a != a and b != b)
+                                  for col in attendu.columns
+                                  for a, b in zip(attendu[col].tolist(), obtenu[col].tolist())))
+            if not identiques:
+                break
+        if not identiques:
+            ecarts += 1
+            if ecarts == 1:
+                print(f"⚠ Écart au PV aléatoire {essai}, lecture {lecture} : {tableaux!r}")
+                print(attendu.to_string(), obtenu.to_string(), sep="\n")
+    return ecarts
+
+def mesurer_etapes(chemin, rapide=True):
+    """Durée (s) de chaque étape de la conversion de `chemin`, exécutée en série dans ce processus."""
+    import io
+    etapes = dict.fromkeys(ETAPES, 0.0)
+    chrono = time.perf_counter
+
+    convertitPV2.fermer_document()
+    t = chrono()
+    doc = convertitPV2.ouvrir_document(chemin)
+    etapes["ouverture"] += chrono() - t
+
+    results = []
+    for i in range(1, len(doc) - 1):
+        t = chrono()
+        page = doc[i]
+        etapes["ouverture"] += chrono() - t
+
+        t = chrono()
+        classe = convertitPV2.classer_texte(page.get_text("text"))
+        etapes["texte"] += chrono() - t
+        if classe not in convertitPV2.CLASSES_EXTRAITES:
+            continue
+
+        t = chrono()
+        page_data = convertitPV2.extraire_tableau(page, rapide)
+        etapes["tableaux"] += chrono() - t
+        if page_data is None:
+            continue
+
+        t = chrono()
+        results.append(convertitPV2.lire_tableau(page_data))
+        etapes["lecture_lignes"] += chrono() - t
+    convertitPV2.fermer_document()
+
+    t = chrono()
+    releve = convertitPV2.fusionner(results)
+    etapes["merge_etudiants"] += chrono() - t
+
+    t = chrono()
+    df = releve.dataframe()
+    etapes["dataframe"] += chrono() - t
+
+    t = chrono()
+    index, colonnes = convertitPV2.plan_export(df)
+    etapes["plan_export"] += chrono() - t
+
+    t = chrono()
+    convertitPV2.ecrire_classeur(io.BytesIO(), index, colonnes)
+    etapes["export"] += chrono() - t
+
+    t = chrono()
+    convertitPV2.ecrire_classeur(io.BytesIO(), index, convertitPV2.plan_simple(colonnes))
+    etapes["export_simple"] += chrono() - t
+
+    return etapes, df.shape
+
+def mesurer_convertit(chemin, repetitions=3, rapide=True, strategie=None):
+    """Durées de bout en bout de convertit (pool compris, sans cache) sur `repetitions` essais."""
+    with open(chemin, 'rb') as f:
+        donnees = f.read()
+    convertitPV2.obtenir_pool()  # Le démarrage du pool n'est pas compté
+    durees = []
+    for _ in range(repetitions):
+        t = time.perf_counter()
+        convertitPV2.convertit(donnees, cache=False, rapide=rapide, strategie=strategie)
+        durees.append(time.perf_counter() - t)
+    return durees
+
+# Mesures de démarrage, chacune dans un interpréteur neuf (imports et pool non encore chargés)
+LOURDS = ("pandas", "numpy", "fitz", "openpyxl", "matplotlib")
+SCRIPT_PAGE = f"""
+import sys, time, json
+t = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+print(json.dumps({{"duree": time.perf_counter() - t, "modules": [m for m in {LOURDS!r} if m in sys.modules]}}))
+"""
+SCRIPT_CONVERSION = """
+import sys, time, json
+t = time.perf_counter()
+import convertitPV2
+if sys.argv[2] == "prechauffe":
+    convertitPV2.prechauffer()
+    t = time.perf_counter()
+with open(sys.argv[1], 'rb') as f:
+    convertitPV2.convertit(f.read(), cache=False, rapide=sys.argv[3] == "1")
+print(json.dumps({"duree": time.perf_counter() - t}))
+"""
+
+def _interpreteur_neuf(script, *arguments):
+    """Exécute `script` dans un nouvel interpréteur (dossier du dépôt) et renvoie sa ligne JSON."""
+    sortie = subprocess.run([sys.executable, "-c", script, *arguments], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ, PVFDS_PRECHAUFFAGE="0"),
+                            check=True).stdout
+    return json.loads(sortie.strip().splitlines()[-1])
+
+def mesurer_demarrage(chemin, rapide=True):
+    """
+    Temps jusqu'à la première page (page de connexion de l'application, modules lourds chargés)
+    et jusqu'à la première conversion, à froid (imports et démarrage du pool compris) ou après
+    convertitPV2.prechauffer().
+    """
+    chemin = os.path.abspath(chemin)
+    page = _interpreteur_neuf(SCRIPT_PAGE)
+    froid = _interpreteur_neuf(SCRIPT_CONVERSION, chemin, "froid", str(int(rapide)))
+    chaud = _interpreteur_neuf(SCRIPT_CONVERSION, chemin, "prechauffe", str(int(rapide)))
+    return {"premiere_page": page["duree"], "modules_premiere_page": page["modules"],
+            "premiere_conversion": froid["duree"], "premiere_conversion_prechauffee": chaud["duree"]}
+
+def comparer(ancien, nouveau):
+    """Affiche, étape par étape, le rapport entre deux résultats de benchmark."""
+    print(f"{'étape':<18}{'avant (ms)':>12}{'après (ms)':>12}{'rapport':>10}")
+    lignes = [(e, ancien["etapes"].get(e), nouveau["etapes"].get(e)) for e in ETAPES]
+    lignes.append(("convertit", ancien["convertit"]["mediane"], nouveau["convertit"]["mediane"]))
+    for mesure in ("premiere_page", "premiere_conversion", "premiere_conversion_prechauffee"):
+        lignes.append((mesure, ancien.get("demarrage", {}).get(mesure), nouveau.get("demarrage", {}).get(mesure)))
+    for etape, a, n in lignes:
+        if a is None or n is None:
+            continue
+        rapport = f"x{a / n:.2f}" if n else "-"
+        print(f"{etape:<18}{a * 1000:>12.1f}{n * 1000:>12.1f}{rapport:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du convertisseur sur des PV synthétiques")
+    parser.add_argument("--etudiants", type=int, default=300)
+    parser.add_argument("--ues", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=25, help="nombre visé de pages de tableau")
+    parser.add_argument("--ues-par-page", type=int, default=12)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--repetitions", type=int, default=3, help="essais de convertit de bout en bout")
+    parser.add_argument("--mode", choices=["rapide", "tables"], default="rapide",
+                        help="extraction par gabarit ou find_tables sur chaque page")
+    parser.add_argument("--pdf", default="benchmark-pv.pdf", help="PV synthétique généré")
+    parser.add_argument("--sortie", default=None, help="fichier JSON des résultats")
+    parser.add_argument("--comparer", default=None, help="résultats JSON d'une exécution précédente")
+    parser.add_argument("--strategie", choices=convertitPV2.STRATEGIES, default=None,
+                        help="exécution imposée à convertit (défaut : PVFDS_STRATEGIE, sinon auto)")
+    parser.add_argument("--demarrage", action="store_true",
+                        help="mesure aussi la première page et la première conversion dans des interpréteurs neufs")
+    parser.add_argument("--verifier", type=int, default=0, metavar="ESSAIS",
+                        help="compare seulement la lecture des tableaux à la lecture case par case "
+                             "sur ESSAIS PV aléatoires")
+    args = parser.parse_args()
+
+    if args.verifier:
+        ecarts = verifier_lecture(args.verifier, args.graine)
+        print(f"Lecture des tableaux : {ecarts} écart(s) sur {args.verifier} PV aléatoires")
+        return 1 if ecarts else 0
+
+    parametres = generer_pv(args.pdf, args.etudiants, args.ues, args.pages, args.ues_par_page, args.graine)
+    rapide = args.mode == "rapide"
+    etapes, forme = mesurer_etapes(args.pdf, rapide)
+    durees = mesurer_convertit(args.pdf, args.repetitions, rapide, args.strategie)
+    strategie = convertitPV2.choisir_strategie(parametres["pages_tableau"], rapide, args.strategie)
+    convertitPV2.fermer_pool()
+    demarrage = mesurer_demarrage(args.pdf, rapide) if args.demarrage else None
+
+    resultat = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "version": convertitPV2.VERSION,
+        "mode": args.mode,
+        "machine": {"python": platform.python_version(), "pymupdf": fitz.VersionBind,
+                    "processeurs": os.cpu_count(), "pool": convertitPV2.NB_PROCESSUS},
+        "parametres": parametres,
+        "lignes": forme[0],
+        "colonnes": forme[1],
+        "etapes": etapes,
+        "convertit": {"essais": durees, "min": min(durees), "mediane": statistics.median(durees),
+                      "strategie": strategie},
+    }
+    if demarrage:
+        resultat["demarrage"] = demarrage
+    sortie = args.sortie or time.strftime("benchmark-%Y%m%d-%H%M%S.json")
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump(resultat, f, ensure_ascii=False, indent=2)
+
+    print(f"PV synthétique : {parametres['pages_tableau']} pages, {forme[0]} étudiants, {forme[1]} colonnes")
+    for etape in ETAPES:
+        print(f"  {etape:<18}{etapes[etape] * 1000:>10.1f} ms")
+    print(f"  {'convertit':<18}{resultat['convertit']['mediane'] * 1000:>10.1f} ms (médiane de {len(durees)}, "
+          f"stratégie {strategie})")
+    if demarrage:
+        print(f"  {'première page':<18}{demarrage['premiere_page'] * 1000:>10.1f} ms "
+              f"(modules lourds : {', '.join(demarrage['modules_premiere_page']) or 'aucun'})")
+        print(f"  {'1re conversion':<18}{demarrage['premiere_conversion'] * 1000:>10.1f} ms à froid, "
+              f"{demarrage['premiere_conversion_prechauffee'] * 1000:.1f} ms après préchauffage")
+    print(f"Résultats enregistrés dans {sortie}")
+
+    if args.comparer:
+        with open(args.comparer, 'r', encoding='utf-8') as f:
+            comparer(json.load(f), resultat)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,200 +1,1221 @@
-import pandas as pd
 import fitz
-import sys
+import os
+import io
+import glob
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import atexit
+import argparse
+import threading
+import bisect
+import re
 import multiprocessing
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Alignment
+import metriques
+import archive
+from artefacts import dossier_prive
+from releve import Releve, lire_tableau, fusionner, type_colonne, NOM, NOTE, STATUT, REGLES
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl.styles.differential import DifferentialStyle
+from openpyxl.formatting.rule import Rule
+from openpyxl.utils import get_column_letter
 
-def traiter_page(fichier, i):
-    """Chaque processus ouvre une copie indépendante du PDF et traite une page."""
+# Version du convertisseur : toute modification du format de sortie doit l'incrémenter
+# pour invalider les résultats déjà présents dans le cache.
+VERSION = "2.2"
+
+# Cache des conversions, indexé par l'empreinte SHA-256 du PDF
+CACHE_DIR = os.environ.get("PVFDS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pvfds"))
+CACHE_TAILLE_MAX = int(os.environ.get("PVFDS_CACHE_TAILLE_MAX", 500 * 1024 * 1024))  # en octets
+
+def empreinte(fichier):
+    """Empreinte SHA-256 du PDF, donné par son chemin ou par son contenu."""
+    if isinstance(fichier, (bytes, bytearray)):
+        return hashlib.sha256(fichier).hexdigest()
+    h = hashlib.sha256()
+    with open(fichier, 'rb') as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+# PDF reçus en octets et traités par le pool : écrits une fois dans ce dossier privé du cache,
+# les tâches n'en transmettent que le chemin ; les marqueurs d'annulation y sont créés aussi
+TEMPORAIRES = "tmp"
+TEMPORAIRES_DUREE = 24 * 3600   # s : fichiers laissés par une conversion interrompue
+
+def _taille_dossier(chemin):
+    return sum(os.path.getsize(os.path.join(chemin, f)) for f in os.listdir(chemin))
+
+def entree_cache(cle, regles=None):
+    """
+    Nom de l'entrée du cache d'un PV : son empreinte suivie de celle des règles de fusion
+    (`regles`, REGLES par défaut, voir PVFDS_FUSION), qui changent le résultat.
+    """
+    regles = ",".join(f"{t}={r}" for t, r in sorted((regles or REGLES).items()))
+    return f"{cle}-{hashlib.sha256(regles.encode()).hexdigest()[:12]}"
+
+def cache_lire(cle, cache_dir=CACHE_DIR):
+    """Renvoie (relevé, classeur, classeur simple) en cache pour `cle`, ou None."""
+    entree = os.path.join(cache_dir, VERSION, entree_cache(cle))
+    try:
+        releve = Releve.lire(entree)
+        with open(os.path.join(entree, "complet.xlsx"), 'rb') as f:
+            complet = f.read()
+        with open(os.path.join(entree, "simple.xlsx"), 'rb') as f:
+            simple = f.read()
+        os.utime(entree)  # Marque l'entrée comme récemment utilisée (LRU)
+        return releve, complet, simple
+    except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+def cache_ecrire(cle, releve, complet, simple, cache_dir=CACHE_DIR, taille_max=CACHE_TAILLE_MAX):
+    """Enregistre le relevé (voir Releve.ecrire) et les octets des deux classeurs, puis purge le cache."""
+    dossier_version = os.path.join(cache_dir, VERSION)
+    try:
+        os.makedirs(dossier_version, exist_ok=True)
+        # Écriture dans un dossier temporaire puis renommage, pour ne jamais exposer une entrée incomplète
+        tmp = tempfile.mkdtemp(dir=dossier_version, prefix=".tmp-")
+        releve.ecrire(tmp)
+        with open(os.path.join(tmp, "complet.xlsx"), 'wb') as f:
+            f.write(complet)
+        with open(os.path.join(tmp, "simple.xlsx"), 'wb') as f:
+            f.write(simple)
+        try:
+            os.rename(tmp, os.path.join(dossier_version, entree_cache(cle)))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # Entrée déjà écrite par une autre conversion
+        cache_purger(cache_dir, taille_max)
+    except OSError as e:
+        print(f"⚠ Cache indisponible : {e}")
+
+def cache_purger(cache_dir=CACHE_DIR, taille_max=CACHE_TAILLE_MAX):
+    """Supprime les dossiers des anciennes versions, puis les moins récemment utilisées au-delà de `taille_max`."""
+    for version in os.listdir(cache_dir):
+        # Seuls les dossiers de version sont concernés (classements, magasin de l'application...)
+        if re.fullmatch(r"\d+(\.\d+)*", version) and version != VERSION:
+            shutil.rmtree(os.path.join(cache_dir, version), ignore_errors=True)
+
+    dossier_version = os.path.join(cache_dir, VERSION)
+    entrees = []
+    for cle in os.listdir(dossier_version):
+        chemin = os.path.join(dossier_version, cle)
+        if cle.startswith(".tmp-"):
+            continue
+        try:
+            entrees.append((os.path.getmtime(chemin), _taille_dossier(chemin), chemin))
+        except OSError:
+            continue
+
+    total = sum(taille for _, taille, _ in entrees)
+    for _, taille, chemin in sorted(entrees):
+        if total <= taille_max:
+            break
+        shutil.rmtree(chemin, ignore_errors=True)
+        total -= taille
+
+    dossier = os.path.join(cache_dir, TEMPORAIRES)
+    if os.path.isdir(dossier):
+        for f in os.scandir(dossier):
+            try:
+                if time.time() - f.stat().st_mtime > TEMPORAIRES_DUREE:
+                    os.remove(f.path)
+            except OSError:
+                pass
+
+    # Classements des pages : quelques centaines d'octets chacun, on garde les plus récents
+    dossier = os.path.join(cache_dir, CLASSEMENTS)
+    if os.path.isdir(dossier):
+        fichiers = sorted(os.scandir(dossier), key=lambda f: f.stat().st_mtime, reverse=True)
+        for f in fichiers[CLASSEMENTS_MAX:]:
+            try:
+                os.remove(f.path)
+            except OSError:
+                pass
+
+# Classement des pages de chaque PV (voir classer_pages), enregistré à côté du cache des
+# conversions sous l'empreinte du PDF : une nouvelle conversion du même PV (sans gabarit,
+# après éviction de son entrée, nouvelle version) n'extrait que les pages de tableau.
+CLASSEMENTS = "classements"
+CLASSEMENTS_MAX = 2000
+
+def classement_lire(cle, nb_pages, cache_dir=CACHE_DIR):
+    """Classes des pages enregistrées pour `cle` (liste d'après le numéro de page), ou None."""
+    try:
+        with open(os.path.join(cache_dir, CLASSEMENTS, cle + ".json"), 'r', encoding='utf-8') as f:
+            classes = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(classes, list) or len(classes) != nb_pages:
+        return None
+    return classes
+
+def classement_ecrire(cle, classes, cache_dir=CACHE_DIR):
+    """Enregistre les classes des pages d'un PV (None pour la page de garde et la page finale)."""
+    dossier = os.path.join(cache_dir, CLASSEMENTS)
     try:
-        doc = fitz.open(fichier)  # Ouvrir une copie du fichier PDF dans le processus
+        os.makedirs(dossier, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dossier, prefix=".tmp-")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(classes, f)
+        os.replace(tmp, os.path.join(dossier, cle + ".json"))
+    except OSError as e:
+        print(f"⚠ Classement des pages non enregistré : {e}")
+
+# Pool de processus partagé par toutes les conversions (sessions Streamlit, ligne de commande)
+NB_PROCESSUS = int(os.environ.get("PVFDS_PROCESSUS", 0)) or multiprocessing.cpu_count()
+_pool = None
+_pool_taille = 0
+_pool_verrou = threading.Lock()
+
+def _init_worker():
+    """Préchauffe un processus du pool : charge PyMuPDF avant la première page."""
+    fitz.open().close()
+
+def obtenir_pool(processes=None):
+    """Renvoie le pool partagé, en le démarrant au premier appel."""
+    global _pool, _pool_taille
+    with _pool_verrou:
+        if _pool is None:
+            _pool_taille = processes or NB_PROCESSUS
+            _pool = multiprocessing.Pool(processes=_pool_taille, initializer=_init_worker)
+        return _pool
+
+def fermer_pool():
+    """Arrête proprement le pool partagé (appelé automatiquement à la sortie)."""
+    global _pool
+    with _pool_verrou:
+        if _pool is not None:
+            _pool.close()
+            _pool.join()
+            _pool = None
+
+def _pret(_):
+    return os.getpid()
+
+def prechauffer():
+    """
+    Démarre le pool partagé et attend que ses processus répondent (PyMuPDF chargé par
+    _init_worker) : la première conversion ne paie plus ni les imports ni le démarrage du pool.
+    """
+    pool = obtenir_pool()
+    pool.map(_pret, range(_pool_taille), chunksize=1)
+
+atexit.register(fermer_pool)
+
+# Extraction rapide : la géométrie des tableaux apprise sur une page sert aux pages suivantes
+EXTRACTION_RAPIDE = os.environ.get("PVFDS_EXTRACTION", "rapide") == "rapide"
+
+# Nombre maximal de pages par tâche : borne le délai avant les premiers résultats
+TAILLE_PLAGE_MAX = 4
+
+# Nombre maximal de gabarits (dispositions de colonnes) appris par document
+GABARITS_MAX = 8
+
+# Stratégie d'exécution d'une conversion : 'serie' dans ce processus, 'reduit' sur quelques
+# processus du pool, 'complet' sur tout le pool. 'auto' prend la plus rapide d'après le nombre
+# de pages et les coûts de page mesurés ; PVFDS_STRATEGIE ou --strategie l'imposent (benchmark).
+STRATEGIES = ("auto", "serie", "reduit", "complet")
+STRATEGIE = os.environ.get("PVFDS_STRATEGIE", "auto")
+PROCESSUS_REDUIT = 2
+SURCOUT_POOL = 0.2      # s : envoi du PDF aux processus et retour des relevés
+DEMARRAGE_POOL = 1.0    # s : démarrage du pool s'il ne tourne pas encore
+
+# Coûts de page mesurés dans ce processus (moyennes glissantes, en secondes), par mode
+# d'extraction : première page d'une plage (gabarits à apprendre) et pages suivantes.
+# Valeurs de départ relevées sur nos PV.
+_couts = {True: [1.0, 0.05], False: [0.8, 0.8]}
+_verrou_serie = threading.Lock()
+
+# Document ouvert par le processus courant, réutilisé pour toutes ses pages,
+# gabarits de tableau appris sur ce document (un par disposition de colonnes) et dispositions
+# dont le gabarit n'a pas pu être appris, pour ne pas retenter l'apprentissage à chaque page
+_document = None
+_gabarits = []
+_echecs = set()
+
+def _ouvrir(source):
+    """Ouvre un PDF donné par son chemin ou par le couple (empreinte, octets)."""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source[1], filetype="pdf")
+
+def ouvrir_document(source):
+    """Renvoie le document déjà ouvert dans ce processus, ou l'ouvre s'il a changé."""
+    global _document, _gabarits, _echecs
+    if isinstance(source, str):
+        stat = os.stat(source)
+        cle = (source, stat.st_mtime_ns, stat.st_size)
+    else:
+        cle = source[0]
+    if _document is None or _document[0] != cle:
+        if _document is not None:
+            _document[1].close()
+        _document = (cle, _ouvrir(source))
+        _gabarits, _echecs = [], set()
+    return _document[1]
+
+def fermer_document():
+    """Ferme le document ouvert par ce processus et oublie ses gabarits."""
+    global _document, _gabarits, _echecs
+    if _document is not None:
+        _document[1].close()
+    _document = None
+    _gabarits, _echecs = [], set()
+
+def _segments_horizontaux(page):
+    """Segments horizontaux (y, x0, x1) des traits et rectangles dessinés sur la page."""
+    segments = []
+    for dessin in page.get_cdrawings():
+        for item in dessin["items"]:
+            if item[0] == "re":
+                r = item[1]
+                segments.append((r[1], r[0], r[2]))
+                segments.append((r[3], r[0], r[2]))
+            elif item[0] == "l" and abs(item[1][1] - item[2][1]) < 0.5:
+                segments.append((item[1][1], min(item[1][0], item[2][0]), max(item[1][0], item[2][0])))
+    # Comme find_tables, on ignore ce qui dépasse de la page
+    return sorted(seg for seg in segments if page.rect.y0 <= seg[0] <= page.rect.y1)
+
+def _filets_horizontaux(segments, x0, x1, tolerance=3):
+    """
+    Ordonnées des filets horizontaux qui traversent toute la largeur [x0, x1] du tableau.
+    Renvoie None si un filet ne couvre qu'une partie des colonnes (cellules fusionnées).
+    """
+    # Regroupement des segments de même ordonnée, puis mesure de la largeur couverte
+    filets = []
+    k = 0
+    while k < len(segments):
+        y = segments[k][0]
+        groupe = []
+        while k < len(segments) and segments[k][0] - y <= tolerance:
+            groupe.append((max(segments[k][1], x0), min(segments[k][2], x1)))
+            k += 1
+        couvert, fin = 0, x0
+        for a, b in sorted(groupe):
+            if b > fin:
+                couvert += b - max(a, fin)
+                fin = b
+        filets.append((y, couvert / (x1 - x0)))
+
+    complets = [y for y, couverture in filets if couverture >= 0.95]
+    if len(complets) < 2:
+        return None
+    if any(0.05 < couverture < 0.95 and complets[0] < y < complets[-1] for y, couverture in filets):
+        return None
+    return complets
+
+def _texte_cellule(mots, tolerance=3):
+    """Assemble les mots d'une cellule comme Table.extract : lignes séparées par \n, mots par un espace."""
+    if not mots:
+        return ""
+    mots.sort(key=lambda m: m[1])
+    lignes = [[mots[0]]]
+    for mot in mots[1:]:
+        if mot[1] - lignes[-1][-1][1] <= tolerance:
+            lignes[-1].append(mot)
+        else:
+            lignes.append([mot])
+    return "\n".join(" ".join(m[4] for m in sorted(ligne, key=lambda m: m[0])) for ligne in lignes)
+
+def extraire_avec_gabarit(page, gabarit, mots=None, segments=None):
+    """
+    Extrait le tableau d'une page à partir des colonnes et de l'entête apprises (gabarit),
+    sans page.find_tables(). Renvoie les lignes comme Table.extract(), ou None si la page
+    ne correspond pas au gabarit. `mots` et `segments` évitent de relire la page quand
+    plusieurs gabarits sont essayés.
+    """
+    colonnes, entete = gabarit
+    if segments is None:
+        segments = _segments_horizontaux(page)
+    filets = _filets_horizontaux(segments, colonnes[0], colonnes[-1])
+    if filets is None:
+        return None
+    if mots is None:
+        mots = page.get_text("words")
+
+    # Répartition des mots dans les cellules (bande horizontale x colonne) selon leur centre
+    cellules = {}
+    for mot in mots:
+        y = (mot[1] + mot[3]) / 2
+        x = (mot[0] + mot[2]) / 2
+        ligne = bisect.bisect(filets, y) - 1
+        col = bisect.bisect(colonnes, x) - 1
+        if 0 <= ligne < len(filets) - 1 and 0 <= col < len(colonnes) - 1:
+            cellules.setdefault((ligne, col), []).append(mot)
+
+    page_data = None
+    for ligne in range(len(filets) - 1):
+        textes = [_texte_cellule(cellules.get((ligne, col), [])) for col in range(len(colonnes) - 1)]
+        if page_data is None:
+            # Les bandes qui précèdent l'entête ne font pas partie du tableau
+            if textes == entete:
+                page_data = [textes]
+            continue
+        page_data.append(textes)
+        if textes[0].startswith('note max'):
+            break
+        # Une ligne que traiter_page ne saurait pas lire est confiée à find_tables
+        premiere = textes[0].split("\n")
+        if len(premiere) < 2 or ":" not in premiere[0]:
+            return None
+    return page_data
+
+def apprendre_gabarit(page, table, page_data):
+    """
+    Gabarit (bords des colonnes, entête) d'un tableau trouvé par find_tables, ou False si
+    l'extraction rapide ne redonne pas exactement le même contenu sur cette page.
+    """
+    cellules = table.rows[0].cells
+    if any(c is None for c in cellules) or any(e is None for e in page_data[0]):
+        return False
+    colonnes = [c[0] for c in cellules] + [cellules[-1][2]]
+    gabarit = (colonnes, page_data[0])
+
+    attendu = page_data
+    for k, ligne in enumerate(page_data):
+        if k > 0 and ligne[0].startswith('note max'):
+            attendu = page_data[:k + 1]
+            break
+    return gabarit if extraire_avec_gabarit(page, gabarit) == attendu else False
+
+def extraire_tableau(page, rapide=EXTRACTION_RAPIDE):
+    """Lignes du premier tableau de la page (comme Table.extract()), ou None s'il n'y en a pas."""
+    if rapide and _gabarits:
+        mots = page.get_text("words")
+        segments = _segments_horizontaux(page)
+        for k, gabarit in enumerate(_gabarits):
+            page_data = extraire_avec_gabarit(page, gabarit, mots, segments)
+            if page_data is not None:
+                # Les pages de continuation alternent souvent : le dernier gabarit utilisé passe devant
+                _gabarits.insert(0, _gabarits.pop(k))
+                return page_data
+
+    t = page.find_tables()
+    if not t.tables:
+        return None
+    page_data = t[0].extract()
+    # Disposition du tableau : bords et entête, tels que find_tables les donne
+    disposition = (round(t[0].bbox[0]), round(t[0].bbox[2]), tuple(page_data[0]) if page_data else ())
+    if rapide and len(_gabarits) < GABARITS_MAX and disposition not in _echecs:
+        gabarit = apprendre_gabarit(page, t[0], page_data)
+        if gabarit:
+            _gabarits.insert(0, gabarit)
+        else:
+            _echecs.add(disposition)
+    return page_data
+
+# Classes des pages d'un PV, d'après leur seul texte : seules les deux premières sont extraites
+TABLEAU = "tableau"  # entête (ou titre) puis lignes d'étudiants
+SUITE = "suite"      # lignes d'étudiants dès le haut de la page (tableau continué)
+PIED = "pied"        # du texte mais aucune ligne d'étudiant : 'note max' seule, récapitulatif, annexe
+VIDE = "vide"        # aucun texte
+CLASSES_EXTRAITES = (TABLEAU, SUITE)
+
+# Ligne d'étudiant : numéro après deux-points en début de ligne ("N°:22000000")
+_LIGNE_ETUDIANT = re.compile(r"^[^\n:]*:\s*\d", re.MULTILINE)
+
+def classer_texte(texte):
+    """Classe d'une page d'après son texte (page.get_text("text"))."""
+    if not texte.strip():
+        return VIDE
+    ligne = _LIGNE_ETUDIANT.search(texte)
+    if ligne is None:
+        return PIED
+    return TABLEAU if texte[:ligne.start()].strip() else SUITE
+
+def _page_ignoree(i, classe):
+    """Signale une page qui n'est pas extraite et renvoie son statut (metriques.STATUTS_PAGE)."""
+    if classe == VIDE:
+        print(f"⚠ Page {i+1} ignorée (pas de texte détecté)")
+        return "sans_texte"
+    print(f"⚠ Page {i+1} ignorée (pas de ligne d'étudiant)")
+    return "sans_tableau"
+
+def classer_pages(doc, cle=None):
+    """
+    Classement des pages d'un PV avant extraction : celui enregistré sous `cle` s'il existe,
+    sinon celui des dernières pages, lues depuis la fin jusqu'à la dernière page à lignes
+    d'étudiants (celle de la ligne 'note max') ; les annexes qui suivent ne sont pas extraites.
+    Renvoie (classes, fin, mesures) : classe de chaque page (None si pas encore lue), fin de la
+    zone à extraire et mesures (statut, durée, classe) des pages qui la suivent.
+    """
+    nb_pages = len(doc)
+    classes = classement_lire(cle, nb_pages) if cle else None
+    if classes is not None:
+        extraites = [i for i in range(1, nb_pages - 1) if classes[i] in CLASSES_EXTRAITES]
+        fin = extraites[-1] + 1 if extraites else 1
+        return classes, fin, [(_page_ignoree(i, classes[i]), None, classes[i]) for i in range(fin, nb_pages - 1)]
+
+    classes = [None] * nb_pages
+    durees = {}
+    fin = nb_pages - 1
+    while fin > 1:
+        t = time.perf_counter()
+        classes[fin - 1] = classer_texte(doc[fin - 1].get_text("text"))
+        if classes[fin - 1] in CLASSES_EXTRAITES:
+            break
+        fin -= 1
+        durees[fin] = time.perf_counter() - t
+    return classes, fin, [(_page_ignoree(i, classes[i]), durees[i], classes[i]) for i in range(fin, nb_pages - 1)]
+
+def decouper_pages(debut, fin, nb_taches):
+    """Découpe l'intervalle de pages [debut, fin) en au plus nb_taches plages contiguës."""
+    nb_pages = max(fin - debut, 0)
+    nb_taches = max(min(nb_taches, nb_pages), 1)
+    taille, reste = divmod(nb_pages, nb_taches)
+    plages = []
+    for k in range(nb_taches):
+        fin_plage = debut + taille + (1 if k < reste else 0)
+        if fin_plage > debut:
+            plages.append((debut, fin_plage))
+        debut = fin_plage
+    return plages
+
+def traiter_plage(tache):
+    """
+    Traite une plage contiguë de pages avec le document ouvert une seule fois par processus.
+    Renvoie (debut, relevé des pages fusionnées, mesures), mesures donnant (statut, durée, classe)
+    pour chaque page. Les pages restantes sont sautées dès que le fichier `marqueur` d'annulation
+    (facultatif) existe. `classes` (facultatif) donne les classes déjà connues des pages : celles
+    qui ne sont pas extraites ne sont pas lues (durée None).
+    """
+    fichier, debut, fin, rapide = tache[:4]
+    marqueur = tache[4] if len(tache) > 4 else None
+    classes = tache[5] if len(tache) > 5 else None
+    pages, mesures = [], []
+    for i in range(debut, fin):
+        if marqueur is not None and os.path.exists(marqueur):
+            break
+        classe = classes[i - debut] if classes else None
+        if classe is not None and classe not in CLASSES_EXTRAITES:
+            mesures.append((_page_ignoree(i, classe), None, classe))
+            continue
+        t = time.perf_counter()
+        releve, statut, classe = _traiter_page(fichier, i, rapide, classe)
+        pages.append(releve)
+        mesures.append((statut, time.perf_counter() - t, classe))
+    return debut, fusionner(pages), mesures
+
+def traiter_plage_lot(tache):
+    """Comme traiter_plage pour le mode lot : renvoie (fichier, debut, relevé, mesures, erreur)."""
+    try:
+        debut, releve, mesures = traiter_plage(tache)
+        return tache[0], debut, releve, mesures, None
+    except Exception as e:
+        return tache[0], tache[1], None, None, str(e)
+
+def _compter_pages(mesure, mesures):
+    """Reporte les (statut, durée, classe) des pages d'une plage dans la mesure de la conversion."""
+    for statut, duree, _ in mesures:
+        mesure["pages"][statut] += 1
+        if duree is not None:
+            mesure["durees_pages"].append(duree)
+
+def _traiter_page(fichier, i, rapide, classe=None):
+    """
+    Traite une page et renvoie (relevé, statut, classe), statut étant l'un de
+    metriques.STATUTS_PAGE. La page est d'abord classée d'après son texte, sauf si sa `classe`
+    est déjà connue ; seules les pages à lignes d'étudiants passent à l'extraction.
+    """
+    try:
+        doc = ouvrir_document(fichier)
         page = doc[i]
 
-        # Vérifier si la page contient du texte
-        texte = page.get_text("text")
-        if not texte.strip():
-            print(f"⚠ Page {i+1} ignorée (pas de texte détecté)")
-            return {}
+        if classe is None:
+            classe = classer_texte(page.get_text("text"))
+        if classe not in CLASSES_EXTRAITES:
+            return Releve.vide(), _page_ignoree(i, classe), classe
 
         # Extraction des tables
-        t = page.find_tables()
-        if not t.tables:
+        page_data = extraire_tableau(page, rapide)
+        if page_data is None:
             print(f"⚠ Page {i+1} ignorée (pas de tableau détecté)")
-            return {}
-
-        page_data = t[0].extract()
-        entete = page_data[0]
-        etudiants = {}
-
-        for ligne in page_data[1:]:
-            if ligne[0].startswith('note max'):
-                break
-            numero = ligne[0].split("\n")[0].split(":")[1]
-
-            # Initialisation de l'étudiant si ce n'est pas déjà fait
-            etudiant = etudiants.setdefault(numero, {'Nom\nPrénom': ligne[0].split("\n")[1]})
-
-            for col in range(1, len(ligne)):
-                if entete[col]:
-                    if not ligne[col].startswith('Résultat'):
-                        note = ligne[col].split("\n")[0]
-                        if not note.startswith("AB") and note != "" and note != "NACQ" and note != "DIS":
-                            note = float(note.split(" ")[-1])
-                            etudiant[entete[col]]=note
-                        else:
-                            etudiant[entete[col]]=note
-                    else:
-                        note = ligne[col].split("\n")[0]
-                        resultat = ligne[col].split("\n")[1]
-                        if not note.startswith("AB") and note != "":
-                            note = float(note.split(" ")[-1])
-                        else:
-                            note = 0
-                        etudiant['Moyenne'] = note
-                        etudiant['Résultat'] = resultat.split(" ")[0]
-        return etudiants
+            return Releve.vide(), "sans_tableau", classe
+
+        return lire_tableau(page_data), "traitee", classe
 
     except Exception as e:
         print(f"⚠ Erreur sur la page {i+1} : {e}")  # Afficher l'erreur sans bloquer le programme
-        return {}
-
-def merge_etudiants(etudiants_list):
-    """Fusionne les données de plusieurs pages pour chaque étudiant."""
-    final_etudiants = {}
-
-    for etudiants in etudiants_list:
-        for numero, data in etudiants.items():
-            if numero not in final_etudiants:
-                final_etudiants[numero] = data
-            else:
-                # Fusionner les notes sans écraser
-                for key, value in data.items():
-                    if key in final_etudiants[numero]:
-                        # Si la clé existe déjà, on écrase la valeur si ce n'est pas une liste
-                        if isinstance(final_etudiants[numero][key], list):
-                            final_etudiants[numero][key].append(value)
-                        else:
-                            final_etudiants[numero][key] = value
-                    else:
-                        final_etudiants[numero][key] = value
-
-    # Moyenne recalculée si nécessaire
-    for numero, data in final_etudiants.items():
-        if 'Moyenne' in data and isinstance(data['Moyenne'], list):
-            data['Moyenne'] = sum(data['Moyenne']) / len(data['Moyenne'])
-
-    return final_etudiants
+        return Releve.vide(), "erreur", classe
+
+def traiter_page(fichier, i, rapide=EXTRACTION_RAPIDE):
+    """Chaque processus garde sa propre copie ouverte du PDF et renvoie le relevé d'une page."""
+    return _traiter_page(fichier, i, rapide)[0]
+
+# Styles des classeurs, créés une seule fois et partagés par toutes les cellules
+COULEURS = {
+    "I": "003050",
+    "C": "C20E1A",
+    "E": "868686",
+    "P": "612978",
+    "M": "8A2F84",
+    "X": "B39CC8",
+    "T": "B0D2BE",
+    "L": "009CDD",
+    "B": "A6C236",
+    "V": "CE5C37",
+
+    "default": "999999"
+}
+POLICES = {
+    "I": "FFFFFF",  # blanc sur fond #003050
+    "C": "FFFFFF",  # blanc sur fond #C20E1A (très foncé)
+    "E": "FFFFFF",  # blanc sur fond #868686 (gris foncé)
+    "P": "FFFFFF",  # blanc sur fond #612978
+    "M": "FFFFFF",  # blanc sur fond #8A2F84
+    "X": "000000",  # noir sur fond #B39CC8 (clair)
+    "T": "000000",  # noir sur fond #B0D2BE (clair)
+    "L": "FFFFFF",  # blanc sur fond #009CDD
+    "V": "000000",  # noir sur fond #A6C236 (clair)
+    "B": "000000",  # noir sur fond #A6C236 (clair)
+    "default": "FFFFFF"  # noir sur fond #DC972A (clair)
+}
+
+def _remplissage(couleur):
+    return PatternFill(start_color=couleur, end_color=couleur, fill_type="solid")
+
+ENTETE_REMPLISSAGES = {k: _remplissage(v) for k, v in COULEURS.items()}
+ENTETE_POLICES = {k: Font(color=v, bold=True) for k, v in POLICES.items()}
+ENTETE_ALIGNEMENT = Alignment(wrap_text=True, horizontal="center", vertical="center")
+BORDURE = Border(left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin"))
+INDEX_POLICE = Font(bold=True)
+INDEX_ALIGNEMENT = Alignment(horizontal="center", vertical="top")
+LIGNE_REMPLISSAGES = (_remplissage("FFFFFF"), _remplissage("FFEFD5"))  # Blanc, orange clair
+MOYENNE_REMPLISSAGES = (_remplissage("FF9999"), _remplissage("99FF99"))  # Rouge, vert
+MOYENNE_POLICE = Font(bold=True)
+NOTE_POLICES = (Font(color="B22222"), Font(color="228B22"))  # Rouge, vert
+
+def _regle(formule, remplissage, police=None):
+    """Règle de mise en forme conditionnelle : la première vraie donne tout le format de la case."""
+    return Rule(type="expression", formula=[formule], stopIfTrue=True,
+                dxf=DifferentialStyle(font=police, fill=remplissage))
+
+def _mise_en_forme(ws, nb_colonnes, nb_lignes):
+    """
+    Couleurs des lignes de données en règles de mise en forme conditionnelle, posées sur des
+    plages : bandes alternées blanc / orange clair, moyenne (colonne C) sur fond rouge ou vert
+    en gras, notes (colonnes D et suivantes) en rouge ou vert. Les plages ne se recouvrent pas
+    et chaque règle donne le format complet de la case, car LibreOffice n'applique que la
+    première condition vraie (Excel s'arrête aussi, stopIfTrue).
+    """
+    fin = nb_lignes + 1
+    bande = "MOD(ROW(),2)=1"
+
+    def bandes():
+        # Une règle ne sert qu'à une plage : sa priorité est fixée quand elle y est ajoutée
+        return [_regle(bande, LIGNE_REMPLISSAGES[1]), _regle("TRUE", LIGNE_REMPLISSAGES[0])]
+
+    plages = {f"A2:{get_column_letter(min(nb_colonnes, 2))}{fin}": bandes()}
+    if nb_colonnes >= 3:
+        plages[f"C2:C{fin}"] = [_regle("AND(ISNUMBER(C2),C2<10)", MOYENNE_REMPLISSAGES[0], MOYENNE_POLICE),
+                                _regle("ISNUMBER(C2)", MOYENNE_REMPLISSAGES[1], MOYENNE_POLICE)] + bandes()
+    if nb_colonnes >= 4:
+        regles = []
+        for police, note in zip(NOTE_POLICES, ("AND(ISNUMBER(D2),D2<10)", "ISNUMBER(D2)")):
+            regles += [_regle(f"AND({note},{bande})", LIGNE_REMPLISSAGES[1], police),
+                       _regle(note, LIGNE_REMPLISSAGES[0], police)]
+        plages[f"D2:{get_column_letter(nb_colonnes)}{fin}"] = regles + bandes()
+    for plage, regles in plages.items():
+        for regle in regles:
+            ws.conditional_formatting.add(plage, regle)
+
+def categorie_ue(nom):
+    """Lettre de catégorie d'UE (7e caractère du code) : couleur d'entête, groupe de colonnes de la vue."""
+    nom = str(nom)
+    return nom[6] if len(nom) > 6 and nom[6] in "ICEPMXTLVB" else "default"
+
+def _valeur(v):
+    """Valeur Python écrite dans la cellule (None pour une case vide)."""
+    if isinstance(v, float) and v != v:
+        return None
+    if hasattr(v, "item"):  # scalaires numpy
+        return _valeur(v.item())
+    return v
+
+def _largeur(valeurs):
+    """Largeur de colonne : plus long texte des valeurs à partir de la deuxième ligne, plus 4."""
+    # Les réels sont mesurés tels qu'enregistrés dans le fichier (16 chiffres significatifs)
+    return max((len(str(float("%.16g" % v)) if isinstance(v, float) else str(v))
+                for v in valeurs[1:] if v), default=0) + 4
+
+def plan_export(df):
+    """
+    Plan d'export d'un DataFrame : index et colonnes (entête, valeurs, largeur), les valeurs
+    étant converties et mesurées une seule fois pour tous les classeurs qui en dérivent.
+    """
+    index = [_valeur(v) for v in df.index]
+    colonnes = []
+    for j, nom in enumerate(df.columns):
+        valeurs = [_valeur(v) for v in df.iloc[:, j].tolist()]
+        colonnes.append((nom, valeurs, _largeur(valeurs)))
+    return index, colonnes
+
+def plan_simple(colonnes):
+    """
+    Colonnes du classeur simplifié : entêtes réduites au code de l'UE, en gardant les trois
+    premières colonnes puis les UE (code de 7 caractères), les blocs numérotés et les UE de type L.
+    """
+    simples = []
+    for k, (nom, valeurs, largeur) in enumerate(colonnes):
+        code = nom.split()[0]
+        if k < 3 or len(str(code)) == 7 or str(code)[-1].isdigit() or (len(str(code))>6) and code[6]=='L':
+            simples.append((code, valeurs, largeur))
+    return simples
+
+def ecrire_classeur(sortie, index, colonnes):
+    """
+    Écrit un classeur stylé en une seule passe (mode write_only) à partir d'un plan d'export.
+    Seules l'entête et la colonne des numéros ont un style par case ; les couleurs des données
+    sont des règles de mise en forme conditionnelle (voir _mise_en_forme).
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+
+    # Largeurs calculées depuis les données, avant l'écriture des lignes
+    ws.column_dimensions["A"].width = _largeur(index)
+    for j, (_, _, largeur) in enumerate(colonnes, start=2):
+        ws.column_dimensions[get_column_letter(j)].width = largeur
+    ws.row_dimensions[1].height = 60
+
+    def cellule(valeur, remplissage=None, police=None, alignement=None, bordure=None):
+        c = WriteOnlyCell(ws, value=valeur)
+        if remplissage is not None:
+            c.fill = remplissage
+        if police is not None:
+            c.font = police
+        if alignement is not None:
+            c.alignment = alignement
+        if bordure is not None:
+            c.border = bordure
+        return c
+
+    entete = [cellule(None, ENTETE_REMPLISSAGES["default"], ENTETE_POLICES["default"], ENTETE_ALIGNEMENT)]
+    for nom, _, _ in colonnes:
+        cat = categorie_ue(nom)
+        entete.append(cellule(str(nom), ENTETE_REMPLISSAGES[cat], ENTETE_POLICES[cat], ENTETE_ALIGNEMENT, BORDURE))
+    ws.append(entete)
+
+    for i, numero in enumerate(index):
+        ws.append([cellule(numero, None, INDEX_POLICE, INDEX_ALIGNEMENT, BORDURE)] + [v[i] for _, v, _ in colonnes])
+    if index:
+        _mise_en_forme(ws, len(colonnes) + 1, len(index))
+
+    wb.save(sortie)
+
+def classeur_octets(index, colonnes):
+    """Octets du classeur stylé décrit par le plan (exécuté dans un processus du pool)."""
+    sortie = io.BytesIO()
+    ecrire_classeur(sortie, index, colonnes)
+    return sortie.getvalue()
 
 def export(fichier, df, simple=""):
-    out=fichier.replace(".pdf", simple+".xlsx")
-    df.to_excel(out,  engine="openpyxl")
-    wb = load_workbook(out)
-    ws = wb.active
-    row_fill1 = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")  # Blanc
-    row_fill2 = PatternFill(start_color="FFEFD5", end_color="FFEFD5", fill_type="solid")  # Orange clair
-
-    header_alignment = Alignment(wrap_text=True, horizontal="center", vertical="center")  
-
-    couleurs = {
-        "I": "003050",
-        "C": "C20E1A",
-        "E": "868686",
-        "P": "612978",
-        "M": "8A2F84",
-        "X": "B39CC8",
-        "T": "B0D2BE",
-        "L": "009CDD",
-        "B": "A6C236",
-        "V": "CE5C37",
-
-        "default": "999999"
-    }
-    polices = {
-        "I": "FFFFFF",  # blanc sur fond #003050
-        "C": "FFFFFF",  # blanc sur fond #C20E1A (très foncé)
-        "E": "FFFFFF",  # blanc sur fond #868686 (gris foncé)
-        "P": "FFFFFF",  # blanc sur fond #612978
-        "M": "FFFFFF",  # blanc sur fond #8A2F84
-        "X": "000000",  # noir sur fond #B39CC8 (clair)
-        "T": "000000",  # noir sur fond #B0D2BE (clair)
-        "L": "FFFFFF",  # blanc sur fond #009CDD
-        "V": "000000",  # noir sur fond #A6C236 (clair)
-        "B": "000000",  # noir sur fond #A6C236 (clair)
-        "default": "FFFFFF"  # noir sur fond #DC972A (clair)
-    }
+    """
+    Écrit le classeur stylé de df à côté du PDF `fichier`, ou dans `fichier` lui-même
+    si c'est un flux binaire (io.BytesIO).
+    """
+    out=os.path.splitext(fichier)[0]+simple+".xlsx" if isinstance(fichier, str) else fichier
+    ecrire_classeur(out, *plan_export(df))
+
+# Formats en colonnes du DataFrame des étudiants (extension des fichiers), pour les traitements
+# en aval : écrits et relus en quelques millisecondes, contrairement aux classeurs
+FORMATS_COLONNES = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+NUMERO = "Numéro"
+
+def table_etudiants(releve):
+    """
+    Table Arrow typée d'un relevé (voir releve.Releve) : numéro, nom et résultat en texte, moyenne
+    et notes en réels, nuls pour un code ou une UE non suivie. Chaque colonne d'UE est suivie de
+    « <UE> statut » : le code lu (AB, NACQ, DIS, "" pour une case vide), nul si une note est lue.
+    Les colonnes sont prises telles quelles dans les matrices de notes et de codes du relevé.
+    """
+    import pyarrow as pa
+    colonnes = {NUMERO: pa.array(releve.numeros, pa.string())}
+    if not len(releve):
+        return pa.table(colonnes)
+    colonnes[NOM] = pa.array(releve.noms, pa.string())
+    categories = pa.array(releve.categories, pa.string())
+    reels = releve.reels()
+    for j, nom in enumerate(releve.colonnes):
+        codes = releve.codes[:, j]
+        textes = codes > NOTE
+        # Codes lus : indices dans les catégories du relevé, nuls pour une note ou une case absente
+        statuts = pa.DictionaryArray.from_arrays(pa.array(codes, pa.int16(), mask=~textes), categories)
+        if type_colonne(nom) == "resultat":
+            colonnes[nom] = statuts
+            continue
+        colonnes[nom] = pa.array(reels[:, j], pa.float64(), from_pandas=True)
+        if type_colonne(nom) == "ue" or textes.any():
+            colonnes[nom + STATUT] = statuts
+    return pa.table(colonnes)
 
-    for cell in ws[1]:  
-        if isinstance(cell.value, str) and len(cell.value)>6 and cell.value[6] in "ICEPMXTLVB":
-            cell.fill = PatternFill(start_color=couleurs[cell.value[6]], end_color=couleurs[cell.value[6]], fill_type="solid")
-            cell.font = Font(color=polices[cell.value[6]], bold=True)
+def colonnes_octets(releve, formats=("parquet",)):
+    """Octets de la table des étudiants d'un relevé dans chacun des `formats` (voir FORMATS_COLONNES)."""
+    return table_octets(table_etudiants(releve), formats)
+
+def table_octets(table, formats=("parquet",)):
+    """Octets d'une table typée (voir table_etudiants) dans chacun des `formats`."""
+    import pyarrow as pa
+    octets = {}
+    for format in formats:
+        sortie = pa.BufferOutputStream()
+        if format == "parquet":
+            import pyarrow.parquet as pq
+            pq.write_table(table, sortie)
+        elif format == "arrow":
+            with pa.ipc.new_file(sortie, table.schema) as f:
+                f.write_table(table)
+        elif format == "csv":
+            import pyarrow.csv as pcsv
+            # Le CSV n'a pas de dictionnaires : colonnes de texte simples
+            pcsv.write_csv(table.cast(pa.schema([pa.field(c.name, pa.string() if pa.types.is_dictionary(c.type)
+                                                          else c.type) for c in table.schema])), sortie)
         else:
-            cell.fill = PatternFill(start_color=couleurs["default"], end_color=couleurs["default"], fill_type="solid")
-            cell.font = Font(color=polices["default"], bold=True)
-        cell.alignment = header_alignment
-
-    for row_index, row in enumerate(ws.iter_rows(min_row=2, max_row=ws.max_row), start=2):
-        fill = row_fill1 if row_index % 2 == 0 else row_fill2
-        for cell in row:
-            cell.fill = fill
-    ws.row_dimensions[1].height = 60
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=3, max_col=3):  # Colonne des moyennes
-        for cell in row:
-            if isinstance(cell.value, (int, float)):
-                if cell.value < 10:
-                    cell.fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")  # Rouge
-                    cell.font = Font(bold=True)
-                else:
-                    cell.fill = PatternFill(start_color="99FF99", end_color="99FF99", fill_type="solid")  # Vert
-                    cell.font = Font(bold=True)
-
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=4, max_col=ws.max_column):  # Colonne des moyennes
-        for cell in row:
-            if isinstance(cell.value, (int, float)):
-                if cell.value < 10:
-                    cell.font = Font(color="B22222")  # Rouge
-                else:
-                    cell.font = Font(color="228B22")   # Vert
-
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter  # Obtenir la lettre de la colonne
-        for cell in col[2:]:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 4  # Ajustement dynamique
+            raise ValueError(f"format en colonnes inconnu : {format}")
+        octets[format] = sortie.getvalue().to_pybytes()
+    return octets
+
+def assembler(par_plage):
+    """Relevé des étudiants à partir des relevés des plages, indexés par leur première page."""
+    # La fusion se fait dans l'ordre des pages, comme avant
+    return fusionner([par_plage[debut] for debut in sorted(par_plage)])
+
+class ConversionAnnulee(Exception):
+    """Conversion interrompue à la demande (voir le paramètre `annulation` de convertit)."""
+
+def _vider_plages(resultats, marqueur):
+    """
+    Après une annulation : signale l'annulation aux processus du pool, qui sautent alors les
+    pages restantes, et attend la fin des plages déjà distribuées pour libérer le pool.
+    Sans `marqueur` (dossier temporaire indisponible), les plages distribuées vont à leur terme.
+    """
+    if marqueur is None:
+        for _ in resultats:
+            pass
+        return
+    # Création exclusive, sans suivre de lien, dans le dossier privé du marqueur (voir _convertir)
+    os.close(os.open(marqueur, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600))
+    try:
+        for _ in resultats:
+            pass
+    finally:
+        os.remove(marqueur)
 
-    wb.save(out)
+def _mesurer_couts(rapide, mesures):
+    """Met à jour les coûts de page du mode d'extraction avec les (statut, durée, classe) d'une plage."""
+    couts = _couts[rapide]
+    k = 0
+    for statut, duree, _ in mesures:
+        if statut == "traitee":
+            couts[k] += 0.2 * (duree - couts[k])
+            k = 1
 
-def convertit(fichier, progress_queue=None):
-    doc = fitz.open(fichier)
-    
-    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
-        results = pool.starmap(traiter_page, [(fichier, i) for i in range(1, len(doc) - 1)])
+def estimer_durees(nb_pages, rapide=EXTRACTION_RAPIDE):
+    """Durée d'extraction estimée pour chaque stratégie, en secondes."""
+    premiere, suivante = _couts[rapide]
+    taille = _pool_taille if _pool is not None else NB_PROCESSUS
+    demarrage = 0 if _pool is not None else DEMARRAGE_POOL
 
-    etudiants = merge_etudiants(results)
+    def duree(processus):
+        return premiere + (-(-max(nb_pages, 1) // processus) - 1) * suivante
 
-    df = pd.DataFrame.from_dict(data=etudiants, orient='index')
-    df2 = pd.DataFrame.from_dict(data=etudiants, orient='index')
-    df2 = df2.rename(columns={col: col.split()[0] for col in df.columns})
-    colonnes_a_garder = list(df2.columns[:3]) + [col for col in df2.columns[3:] 
-                                         if len(str(col)) == 7 or 
-                                            str(col)[-1].isdigit() or (len(str(col))>6) and col[6]=='L']
+    return {"serie": duree(1),
+            "reduit": demarrage + SURCOUT_POOL + duree(min(PROCESSUS_REDUIT, taille)),
+            "complet": demarrage + SURCOUT_POOL + duree(taille)}
 
-    # Filtrer le DataFrame
-    df_simple = df2[colonnes_a_garder]
-    export(fichier, df)
-    export(fichier, df_simple,"-simple")
+def choisir_strategie(nb_pages, rapide=EXTRACTION_RAPIDE, strategie=None):
+    """Stratégie imposée (argument, puis STRATEGIE), ou la plus rapide estimée, 'serie' à égalité."""
+    strategie = strategie or STRATEGIE
+    if strategie != "auto":
+        return strategie
+    durees = estimer_durees(nb_pages, rapide)
+    return min(durees, key=durees.get)
+
+def _plages_en_serie(taches):
+    """Traite les plages une à une dans ce processus, un thread à la fois (document partagé)."""
+    for tache in taches:
+        with _verrou_serie:
+            resultat = traiter_plage(tache)
+        yield resultat
+
+def _convertir(source, progress_queue, rapide, mesure, annulation=None, strategie=None, cle=None):
+    """
+    Extrait les étudiants du PDF et renvoie (relevé, octets du classeur, octets du classeur simple),
+    en reportant durées et compteurs dans `mesure` (voir metriques.nouvelle_mesure).
+    Lève ConversionAnnulee si `annulation` (threading.Event) est positionné entre deux plages.
+    Les pages sont traitées selon `strategie` (voir choisir_strategie). Avec `cle`, le classement
+    des pages est relu puis enregistré sous cette empreinte (voir classer_pages).
+    """
+    t = time.perf_counter()
+    with _ouvrir(source) as doc:
+        nb_pages_doc = len(doc)
+        classes, fin, annexes = classer_pages(doc, cle)
+    _compter_pages(mesure, annexes)
+
+    nb_pages = max(nb_pages_doc - 2, 0)
+    a_extraire = sum(classe in CLASSES_EXTRAITES or classe is None for classe in classes[1:fin])
+    strategie = choisir_strategie(a_extraire, rapide, strategie)
+    pool = None if strategie == "serie" else obtenir_pool()
+    if strategie == "serie":
+        # Plages courtes pour la progression et l'annulation
+        nb_plages = -(-(fin - 1) // TAILLE_PLAGE_MAX)
+    elif strategie == "reduit":
+        # Une plage par processus employé : les autres restent libres
+        nb_plages = min(PROCESSUS_REDUIT, _pool_taille)
+    else:
+        # Au moins deux plages par processus pour équilibrer la charge, et des plages courtes
+        # pour que les premiers résultats arrivent vite
+        nb_plages = max(2 * _pool_taille, -(-(fin - 1) // TAILLE_PLAGE_MAX))
+    plages = decouper_pages(1, fin, nb_plages)
+
+    # Les plages sont consommées dans l'ordre où elles se terminent ; chaque plage terminée est
+    # signalée sur progress_queue sous la forme (pages traitées, nombre de pages, relevé de la plage)
+    par_plage = {}
+    pages_traitees = len(annexes)
+    # Dossier privé, seulement s'il sert : marqueur d'annulation (créé seulement à l'annulation, nom
+    # imprévisible) et PDF en octets pour le pool. Sans lui, comme pour le cache, la conversion continue :
+    # octets joints aux tâches, annulation sans marqueur.
+    marqueur = fichier_pool = None
+    octets_pool = pool is not None and not isinstance(source, str)
+    if annulation is not None or octets_pool:
+        try:
+            temporaires = dossier_prive(os.path.join(CACHE_DIR, TEMPORAIRES))
+            if annulation is not None:
+                marqueur = os.path.join(temporaires, f"annulation-{os.urandom(8).hex()}")
+            if octets_pool:
+                # Les octets du PDF ne sont pas joints à chaque tâche : un seul fichier, lu par chaque processus
+                fd, fichier_pool = tempfile.mkstemp(dir=temporaires, prefix=source[0][:16] + "-", suffix=".pdf")
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(source[1])
+                except OSError:
+                    os.remove(fichier_pool)
+                    fichier_pool = None
+                    raise
+        except OSError as e:
+            print(f"⚠ Dossier temporaire indisponible : {e}")
+    try:
+        taches = [(fichier_pool or source, d, f, rapide, marqueur, tuple(classes[d:f])) for d, f in plages]
+        resultats = _plages_en_serie(taches) if pool is None else pool.imap_unordered(traiter_plage, taches)
+        for debut, releve, mesures in resultats:
+            if annulation is not None and annulation.is_set():
+                _vider_plages(resultats, marqueur)
+                raise ConversionAnnulee("conversion annulée")
+            par_plage[debut] = releve
+            pages_traitees += len(mesures)
+            classes[debut:debut + len(mesures)] = [classe for _, _, classe in mesures]
+            _compter_pages(mesure, mesures)
+            _mesurer_couts(rapide, mesures)
+            if progress_queue is not None:
+                progress_queue.put((pages_traitees, nb_pages, releve))
+    finally:
+        if fichier_pool is not None:
+            os.remove(fichier_pool)
+    mesure["duree_extraction"] = time.perf_counter() - t
+    if cle is not None and None not in classes[1:-1]:
+        classement_ecrire(cle, classes)
+
+    t = time.perf_counter()
+    releve = assembler(par_plage)
+    mesure["etudiants"] = len(releve)
+    mesure["duree_assemblage"] = time.perf_counter() - t
+
+    # Un seul plan pour les deux classeurs, écrits en parallèle par le pool (sauf en série)
+    t = time.perf_counter()
+    index, colonnes = plan_export(releve.dataframe())
+    if pool is None:
+        resultat = releve, classeur_octets(index, colonnes), classeur_octets(index, plan_simple(colonnes))
+    else:
+        complet = pool.apply_async(classeur_octets, (index, colonnes))
+        simple = pool.apply_async(classeur_octets, (index, plan_simple(colonnes)))
+        resultat = releve, complet.get(), simple.get()
+    mesure["duree_export"] = time.perf_counter() - t
+    return resultat
+
+def convertit(fichier, progress_queue=None, cache=True, rapide=EXTRACTION_RAPIDE, annulation=None, strategie=None,
+              formats=(), session=None, nom_pdf=None):
+    """
+    Convertit un PV donné par son chemin, ou par son contenu (bytes ou flux binaire).
+
+    Avec un chemin, les deux classeurs sont écrits à côté du PDF, ainsi que la table des
+    étudiants dans chacun des `formats` en colonnes (voir FORMATS_COLONNES), et le DataFrame
+    typé des étudiants (voir Releve.frame : notes float32, statuts catégoriels) est renvoyé.
+    Avec un contenu, rien n'est écrit sur disque (hors cache) et la fonction renvoie
+    (df, classeur, classeur simple), df typé de même et les classeurs sous forme de io.BytesIO,
+    suivis avec des `formats` du dictionnaire de leurs octets (voir colonnes_octets).
+    `annulation` (threading.Event) interrompt la conversion par ConversionAnnulee, qui n'est
+    pas comptée dans les métriques. `strategie` impose l'exécution (voir choisir_strategie).
+    Si l'archive est activée (archive.ARCHIVE), le PV y est ajouté sous le libellé `session`
+    (défaut : nom du PDF, `nom_pdf` pour un contenu), sauf s'il y est déjà.
+    """
+    debut = time.perf_counter()
+    mesure = metriques.nouvelle_mesure()
+    annulee = False
+    try:
+        resultat = _convertir_avec_cache(fichier, progress_queue, cache, rapide, mesure, annulation, strategie,
+                                         formats, session, nom_pdf)
+    except ConversionAnnulee:
+        annulee = True
+        raise
+    except Exception:
+        mesure["erreur"] = True
+        raise
+    finally:
+        mesure["duree"] = time.perf_counter() - debut
+        if not annulee:
+            metriques.enregistrer_conversion(mesure)
+    return resultat
+
+def _convertir_avec_cache(fichier, progress_queue, cache, rapide, mesure, annulation=None, strategie=None,
+                          formats=(), session=None, nom_pdf=None):
+    """Corps de convertit : cache, conversion, archive, puis écriture des classeurs ou renvoi des flux."""
+    en_memoire = not isinstance(fichier, (str, os.PathLike))
+    if en_memoire:
+        donnees = fichier.read() if hasattr(fichier, "read") else bytes(fichier)
+        cle = empreinte(donnees)
+        source = (cle, donnees)
+    else:
+        fichier = os.fspath(fichier)
+        cle = empreinte(fichier) if cache else None
+        source = fichier
+
+    resultat = cache_lire(cle) if cache else None
+    if resultat is None:
+        resultat = _convertir(source, progress_queue, rapide, mesure, annulation, strategie, cle if cache else None)
+        if cache:
+            cache_ecrire(cle, *resultat)
+    else:
+        mesure["cache"] = True
+        mesure["etudiants"] = len(resultat[0])
+    releve, complet, simple = resultat
+    df = releve.frame()
+    if archive.ARCHIVE:
+        nom_pdf = nom_pdf or ("" if en_memoire else os.path.basename(fichier))
+        archive.archiver(cle or empreinte(fichier), releve, session or os.path.splitext(nom_pdf)[0] or cle[:12], nom_pdf)
+
+    if en_memoire:
+        if formats:
+            return df, io.BytesIO(complet), io.BytesIO(simple), colonnes_octets(releve, formats)
+        return df, io.BytesIO(complet), io.BytesIO(simple)
+    # Chemins d'après l'extension retirée (.pdf ou .PDF), jamais le PDF lui-même
+    colonnes = colonnes_octets(releve, formats)
+    for chemin, octets in zip(chemins_sortie(fichier, formats=formats),
+                              (complet, simple) + tuple(colonnes[f] for f in formats)):
+        with open(chemin, 'wb') as f:
+            f.write(octets)
     return df
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        convertit(sys.argv[1])
+def lister_pdf(entrees):
+    """Fichiers PDF désignés par des chemins, des dossiers (parcourus récursivement) ou des motifs glob."""
+    fichiers = []
+    for entree in entrees:
+        if os.path.isdir(entree):
+            trouves = [os.path.join(racine, nom) for racine, _, noms in os.walk(entree) for nom in noms]
+        elif os.path.exists(entree):
+            trouves = [entree]
+        else:
+            trouves = glob.glob(entree, recursive=True)
+        for fichier in sorted(trouves):
+            if fichier.lower().endswith(".pdf") and fichier not in fichiers:
+                fichiers.append(fichier)
+    return fichiers
+
+def racine_lot(fichiers):
+    """Dossier commun aux PDF d'un lot : leurs sous-dossiers sont reproduits dans le dossier de sortie."""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in fichiers]) if fichiers else None
+
+def chemins_sortie(fichier, sortie=None, formats=(), racine=None):
+    """
+    Chemins des deux classeurs d'un PV, puis de ses `formats` en colonnes : à côté du PDF,
+    ou dans le dossier `sortie`, sous le chemin du PDF relatif à `racine` (voir racine_lot ;
+    sans racine, sous son seul nom). Deux PV de même nom dans des sous-dossiers différents
+    n'écrivent donc pas les mêmes fichiers.
+    """
+    if sortie is None:
+        base = fichier
+    elif racine is None:
+        base = os.path.join(sortie, os.path.basename(fichier))
     else:
-        print("Usage: convertitPV fichier.pdf")
-        print("Attention: l'information des UEs acquises antérieurement disparait.")
+        base = os.path.join(sortie, os.path.relpath(os.path.abspath(fichier), racine))
+    base = os.path.splitext(base)[0]
+    return (base + ".xlsx", base + "-simple.xlsx") + tuple(base + FORMATS_COLONNES[f] for f in formats)
+
+def _ecrire_bilan(bilan, contenu):
+    """Écrit le bilan du lot de façon atomique, pour pouvoir reprendre après une interruption."""
+    tmp = bilan + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(contenu, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, bilan)
+
+def convertit_lot(fichiers, sortie=None, bilan="bilan-lot.json", reprendre=False, cache=True,
+                  rapide=EXTRACTION_RAPIDE, formats=(), session=None):
+    """
+    Convertit un lot de PV avec un seul ordonnanceur de pages : les plages de tous les documents
+    sont placées dans la même file du pool, de sorte que les petits PV ne laissent pas de
+    processus inoccupés. Chaque PV terminé est exporté, puis consigné dans le fichier `bilan`
+    (durées, nombre de pages et d'étudiants, erreurs). Avec `reprendre`, les PV déjà réussis
+    d'après le bilan existant (même empreinte, classeurs présents) ne sont pas retraités.
+    Chacun des `formats` en colonnes est écrit à côté des classeurs ; dans `sortie`, les
+    sous-dossiers des PV sous leur dossier commun sont reproduits. Si l'archive est activée,
+    chaque PV y est ajouté sous le libellé `session` (défaut : nom du PDF).
+    """
+    debut_lot = time.perf_counter()
+    precedents = {}
+    if reprendre and os.path.exists(bilan):
+        with open(bilan, 'r', encoding='utf-8') as f:
+            precedents = {pv["fichier"]: pv for pv in json.load(f).get("pv", [])}
+    racine = racine_lot(fichiers) if sortie is not None else None
+
+    contenu = {"debut": time.strftime("%Y-%m-%d %H:%M:%S"), "pv": []}
+    pvs = {}
+
+    def terminer(fichier, **champs):
+        pv = pvs[fichier]
+        pv.update(champs)
+        pv["duree"] = round(time.perf_counter() - pv.pop("_debut"), 3)
+        pv.pop("_plages", None)
+        pv.pop("_resultats", None)
+        pv.pop("_classes", None)
+        mesure = pv.pop("_mesure")
+        mesure.update(duree=pv["duree"], erreur=pv["statut"] == "erreur", cache=bool(pv.get("cache")),
+                      etudiants=pv.get("etudiants", 0), duree_extraction=sum(mesure["durees_pages"]))
+        metriques.enregistrer_conversion(mesure)
+        contenu["pv"].append(pv)
+        if pv["statut"] == "ok":
+            print(f"✔ {fichier} : {pv['etudiants']} étudiants ({pv['duree']} s)")
+        else:
+            print(f"⚠ {fichier} : {pv['erreur']}")
+        _ecrire_bilan(bilan, contenu)
+
+    def exporter(fichier, releve, complet, simple):
+        colonnes = colonnes_octets(releve, formats)
+        chemins = chemins_sortie(fichier, sortie, formats, racine)
+        os.makedirs(os.path.dirname(chemins[0]) or ".", exist_ok=True)
+        for chemin, octets in zip(chemins,
+                                  (complet, simple) + tuple(colonnes[f] for f in formats)):
+            with open(chemin, 'wb') as f:
+                f.write(octets)
+        if archive.ARCHIVE:
+            nom_pdf = os.path.basename(fichier)
+            pvs[fichier]["archive"] = archive.archiver(pvs[fichier]["empreinte"], releve,
+                                                       session or os.path.splitext(nom_pdf)[0], nom_pdf)
+        terminer(fichier, statut="ok", etudiants=len(releve))
+
+    # Préparation : reprise, cache, puis découpage en plages des documents à traiter
+    taches = []
+    for fichier in fichiers:
+        pvs[fichier] = pv = {"fichier": fichier, "_debut": time.perf_counter(), "_mesure": metriques.nouvelle_mesure()}
+        try:
+            pv["empreinte"] = cle = empreinte(fichier)
+            precedent = precedents.get(fichier)
+            if (precedent and precedent.get("statut") == "ok" and precedent.get("empreinte") == cle
+                    and all(os.path.exists(c) for c in chemins_sortie(fichier, sortie, formats, racine))):
+                pvs.pop(fichier)
+                contenu["pv"].append(dict(precedent, repris=True))
+                continue
+            resultat = cache_lire(cle) if cache else None
+            if resultat is not None:
+                pv["cache"] = True
+                exporter(fichier, *resultat)
+                continue
+            with fitz.open(fichier) as doc:
+                pv["pages"] = len(doc)
+                classes, fin, annexes = classer_pages(doc, cle if cache else None)
+            _compter_pages(pv["_mesure"], annexes)
+            plages = decouper_pages(1, fin, -(-max(fin - 1, 0) // TAILLE_PLAGE_MAX))
+            pv["_plages"] = len(plages)
+            pv["_resultats"] = {}
+            pv["_classes"] = classes
+            taches += [(fichier, d, f, rapide, None, tuple(classes[d:f])) for d, f in plages]
+            if not plages:
+                releve = assembler({})
+                index, colonnes = plan_export(releve.dataframe())
+                exporter(fichier, releve, classeur_octets(index, colonnes), classeur_octets(index, plan_simple(colonnes)))
+        except Exception as e:
+            terminer(fichier, statut="erreur", erreur=str(e))
+
+    # Traitement de toutes les plages dans une file commune, export de chaque PV dès sa dernière plage
+    for fichier, debut, releve, mesures, erreur in obtenir_pool().imap_unordered(traiter_plage_lot, taches):
+        pv = pvs[fichier]
+        if "statut" in pv:
+            continue  # PV déjà en échec
+        if erreur is not None:
+            terminer(fichier, statut="erreur", erreur=f"page {debut + 1} : {erreur}")
+            continue
+        pv["_resultats"][debut] = releve
+        pv["_classes"][debut:debut + len(mesures)] = [classe for _, _, classe in mesures]
+        _compter_pages(pv["_mesure"], mesures)
+        if len(pv["_resultats"]) < pv["_plages"]:
+            continue
+        try:
+            classes = pv["_classes"][1:-1]
+            pv["classement"] = {classe: classes.count(classe) for classe in (TABLEAU, SUITE, PIED, VIDE)}
+            if cache and None not in classes:
+                classement_ecrire(pv["empreinte"], pv["_classes"])
+            releve = assembler(pv["_resultats"])
+            t = time.perf_counter()
+            index, colonnes = plan_export(releve.dataframe())
+            complet = classeur_octets(index, colonnes)
+            simple = classeur_octets(index, plan_simple(colonnes))
+            pv["_mesure"]["duree_export"] = time.perf_counter() - t
+            if cache:
+                cache_ecrire(pv["empreinte"], releve, complet, simple)
+            exporter(fichier, releve, complet, simple)
+        except Exception as e:
+            terminer(fichier, statut="erreur", erreur=str(e))
 
+    contenu["duree"] = round(time.perf_counter() - debut_lot, 3)
+    contenu["total"] = {
+        "pv": len(contenu["pv"]),
+        "reussis": sum(pv.get("statut") == "ok" for pv in contenu["pv"]),
+        "echecs": sum(pv.get("statut") == "erreur" for pv in contenu["pv"]),
+        "repris": sum(bool(pv.get("repris")) for pv in contenu["pv"]),
+        "pages": sum(pv.get("pages", 0) for pv in contenu["pv"] if not pv.get("repris")),
+    }
+    _ecrire_bilan(bilan, contenu)
+    return contenu
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="convertitPV",
+                                     epilog="Attention: l'information des UEs acquises antérieurement disparait.")
+    parser.add_argument("fichiers", nargs="+", metavar="fichier.pdf",
+                        help="fichiers PDF, dossiers ou motifs (ex. 'PV/**/*.pdf')")
+    parser.add_argument("--sans-cache", action="store_true", help="ignorer le cache des conversions")
+    parser.add_argument("--sans-gabarit", action="store_true",
+                        help="extraire chaque page avec find_tables, sans l'extraction rapide")
+    parser.add_argument("--processus", type=int, default=None, help="taille du pool (défaut : nombre de coeurs)")
+    parser.add_argument("--sortie", default=None, help="dossier des classeurs en mode lot (défaut : à côté des PDF)")
+    parser.add_argument("--bilan", default="bilan-lot.json", help="bilan du lot (durées, échecs)")
+    parser.add_argument("--reprendre", action="store_true", help="reprendre un lot interrompu d'après son bilan")
+    parser.add_argument("--format", dest="formats", action="append", choices=list(FORMATS_COLONNES), default=[],
+                        help="écrire aussi le DataFrame en parquet, arrow ou csv (répétable)")
+    parser.add_argument("--strategie", choices=STRATEGIES, default=None,
+                        help="exécution d'un PV seul : série, pool réduit ou complet (défaut : auto)")
+    parser.add_argument("--archive", default=None, metavar="BASE",
+                        help="ajouter les PV à l'archive SQLite BASE (défaut : $PVFDS_ARCHIVE, sinon aucune)")
+    parser.add_argument("--session", default=None, help="libellé de session des PV archivés (défaut : nom du PDF)")
+    args = parser.parse_args()
 
+    # Une entrée mal saisie ne doit pas donner un lot vide « réussi »
+    introuvables = [entree for entree in args.fichiers if not lister_pdf([entree])]
+    if introuvables:
+        parser.error("aucun PDF pour : " + ", ".join(introuvables))
+    fichiers = lister_pdf(args.fichiers)
+    # Le pool n'est démarré que si la conversion en a besoin (un petit PV est traité en série)
+    NB_PROCESSUS = args.processus or NB_PROCESSUS
+    archive.ARCHIVE = args.archive or archive.ARCHIVE
+    if len(fichiers) == 1 and fichiers == args.fichiers and args.sortie is None and not args.reprendre:
+        convertit(fichiers[0], cache=not args.sans_cache, rapide=not args.sans_gabarit, strategie=args.strategie,
+                  formats=args.formats, session=args.session)
+    else:
+        bilan = convertit_lot(fichiers, args.sortie, args.bilan, args.reprendre,
+                              cache=not args.sans_cache, rapide=not args.sans_gabarit, formats=args.formats,
+                              session=args.session)
+        total = bilan["total"]
+        print(f"{total['reussis']}/{total['pv']} PV convertis ({total['repris']} repris, "
+              f"{total['echecs']} échecs) en {bilan['duree']} s")
+    fermer_pool()
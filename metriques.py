@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+from datetime import datetime
+
+# Dossier des métriques de conversion (à côté de metrics.json par défaut)
+METRIQUES_DIR = os.environ.get("PVFDS_METRIQUES_DIR", ".")
+BASE = "metriques.sqlite"            # événements de conversion (ajout seul) et agrégats par jour
+EXPOSITION = "metriques.prom"        # format texte Prometheus, lisible par node_exporter (textfile)
+HISTORIQUE = "metrics.json"          # ancien compteur quotidien de l'application, repris à la création
+FENETRE = 200                        # nombre de conversions conservées pour les quantiles (seulement)
+ATTENTE = 30                         # secondes d'attente d'un verrou d'écriture
+
+STATUTS_PAGE = ("traitee", "sans_texte", "sans_tableau", "erreur")
+
+# Compteurs agrégés par jour, mis à jour dans la même transaction que l'ajout de l'événement
+COMPTEURS = ("conversions", "conversions_cache", "erreurs", "etudiants", "duree") + \
+    tuple("pages_" + statut for statut in STATUTS_PAGE)
+# Sommes et nombres des conversions hors cache et sans erreur, et des pages qu'elles ont lues :
+# _sum et _count des résumés, cumulés depuis la création de la base comme des compteurs
+EXTRACTIONS = {
+    "extractions": "COUNT(*)",
+    "somme_duree": "TOTAL(duree)",
+    "somme_duree_extraction": "TOTAL(duree_extraction)",
+    "somme_duree_export": "TOTAL(duree_export)",
+    "pages_mesurees": "IFNULL(SUM(json_array_length(durees_pages)), 0)",
+    "somme_duree_pages": "TOTAL((SELECT TOTAL(value) FROM json_each(durees_pages)))",
+}
+COMPTEURS += tuple(EXTRACTIONS)
+REELS = ("duree", "somme_duree", "somme_duree_extraction", "somme_duree_export", "somme_duree_pages")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS conversions (
+    id INTEGER PRIMARY KEY,
+    date REAL NOT NULL,
+    jour TEXT NOT NULL,
+    cache INTEGER NOT NULL,
+    erreur INTEGER NOT NULL,
+    pages INTEGER NOT NULL,
+    {", ".join(f"pages_{statut} INTEGER NOT NULL" for statut in STATUTS_PAGE)},
+    etudiants INTEGER NOT NULL,
+    duree REAL NOT NULL,
+    duree_extraction REAL NOT NULL,
+    duree_assemblage REAL NOT NULL,
+    duree_export REAL NOT NULL,
+    durees_pages TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversions_extraites ON conversions (id) WHERE cache = 0 AND erreur = 0;
+CREATE TABLE IF NOT EXISTS jours (
+    jour TEXT PRIMARY KEY,
+    {", ".join(f"{compteur} {'REAL' if compteur in REELS else 'INTEGER'} NOT NULL DEFAULT 0" for compteur in COMPTEURS)}
+)
+"""
+
+def quantile(valeurs, q):
+    """Quantile q (entre 0 et 1) par interpolation linéaire, None si la liste est vide."""
+    if not valeurs:
+        return None
+    valeurs = sorted(valeurs)
+    position = (len(valeurs) - 1) * q
+    bas = int(position)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (position - bas)
+
+def nouvelle_mesure():
+    """Mesure vide d'une conversion, complétée par convertit."""
+    return {"cache": False, "erreur": False, "duree": 0.0, "duree_extraction": 0.0, "duree_assemblage": 0.0,
+            "duree_export": 0.0, "etudiants": 0, "pages": dict.fromkeys(STATUTS_PAGE, 0), "durees_pages": []}
+
+def _connexion(dossier):
+    """
+    Connexion à la base des métriques, créée au besoin (en reprenant metrics.json). Les
+    transactions sont explicites ; le mode WAL laisse lire pendant qu'une conversion écrit.
+    """
+    chemin = os.path.join(dossier, BASE)
+    connexion = sqlite3.connect(chemin, timeout=ATTENTE, isolation_level=None)
+    connexion.execute("PRAGMA journal_mode=WAL")
+    if connexion.execute("SELECT name FROM sqlite_master WHERE name = 'jours'").fetchone() is None:
+        connexion.execute("BEGIN IMMEDIATE")
+        try:
+            nouvelle = connexion.execute("SELECT name FROM sqlite_master WHERE name = 'jours'").fetchone() is None
+            for instruction in SCHEMA.split(";"):
+                connexion.execute(instruction)
+            if nouvelle:
+                _reprendre_historique(connexion, dossier)
+            connexion.execute("COMMIT")
+        except BaseException:
+            connexion.execute("ROLLBACK")
+            connexion.close()
+            raise
+    if len(connexion.execute("PRAGMA table_info(jours)").fetchall()) < len(COMPTEURS) + 1:
+        _ajouter_compteurs(connexion)
+    return connexion
+
+def _ajouter_compteurs(connexion):
+    """
+    Base d'une version précédente : ajoute les compteurs manquants aux agrégats quotidiens et
+    calcule ceux des extractions d'après les événements déjà enregistrés.
+    """
+    connexion.execute("BEGIN IMMEDIATE")
+    try:
+        presents = {ligne[1] for ligne in connexion.execute("PRAGMA table_info(jours)")}
+        for compteur in COMPTEURS:
+            if compteur not in presents:
+                connexion.execute(f"ALTER TABLE jours ADD COLUMN {compteur} "
+                                  f"{'REAL' if compteur in REELS else 'INTEGER'} NOT NULL DEFAULT 0")
+        if not set(EXTRACTIONS) <= presents:
+            connexion.execute(
+                f"UPDATE jours SET ({', '.join(EXTRACTIONS)}) = (SELECT {', '.join(EXTRACTIONS.values())} "
+                "FROM conversions c WHERE c.jour = jours.jour AND cache = 0 AND erreur = 0)")
+        connexion.execute("COMMIT")
+    except BaseException:
+        connexion.execute("ROLLBACK")
+        connexion.close()
+        raise
+
+def _reprendre_historique(connexion, dossier):
+    """Reprend les compteurs quotidiens de metrics.json (jj-mm-aaaa -> nombre de conversions)."""
+    try:
+        with open(os.path.join(dossier, HISTORIQUE), 'r', encoding='utf-8') as f:
+            historique = json.load(f)
+    except (OSError, ValueError):
+        return
+    for date, nombre in historique.items():
+        try:
+            jour = datetime.strptime(date, "%d-%m-%Y").strftime("%Y-%m-%d")
+            connexion.execute("INSERT INTO jours (jour, conversions) VALUES (?, ?)", (jour, int(nombre)))
+        except (ValueError, TypeError, sqlite3.IntegrityError):
+            continue
+
+def _ecrire(chemin, texte):
+    """Remplace `chemin` d'un coup par `texte`, via un fichier temporaire propre à chaque écriture (threads compris)."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(chemin) or ".", prefix=os.path.basename(chemin) + ".",
+                               suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(texte)
+        os.chmod(tmp, 0o644)  # lisible par node_exporter, comme avant (mkstemp crée en 0600)
+        os.replace(tmp, chemin)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _resume(lignes, nom, aide, valeurs, somme, nombre):
+    """
+    Ajoute une métrique de type summary : quantiles 0.5 et 0.95 sur la fenêtre (`valeurs`),
+    somme et nombre cumulés depuis la création de la base, qui ne décroissent jamais.
+    """
+    lignes.append(f"# HELP {nom} {aide}")
+    lignes.append(f"# TYPE {nom} summary")
+    for q in (0.5, 0.95):
+        v = quantile(valeurs, q)
+        lignes.append(f'{nom}{{quantile="{q}"}} {v if v is not None else "NaN"}')
+    lignes.append(f"{nom}_sum {somme}")
+    lignes.append(f"{nom}_count {nombre}")
+
+def _recentes(connexion, colonnes):
+    """Colonnes des FENETRE dernières conversions hors cache et sans erreur."""
+    return connexion.execute(f"SELECT {', '.join(colonnes)} FROM conversions WHERE cache = 0 AND erreur = 0 "
+                             "ORDER BY id DESC LIMIT ?", (FENETRE,)).fetchall()
+
+def _etat(connexion):
+    """Totaux (somme des agrégats quotidiens) et dernières conversions extraites, pour l'exposition."""
+    sommes = connexion.execute(f"SELECT {', '.join(f'SUM({c})' for c in COMPTEURS)} FROM jours").fetchone()
+    totaux = {compteur: valeur or 0 for compteur, valeur in zip(COMPTEURS, sommes)}
+    derniere = connexion.execute("SELECT date FROM conversions ORDER BY id DESC LIMIT 1").fetchone()
+    totaux["derniere"] = round(derniere[0]) if derniere else 0
+    colonnes = ("duree", "duree_extraction", "duree_export", "durees_pages")
+    recentes = [dict(zip(colonnes, ligne[:3] + (json.loads(ligne[3]),)))
+                for ligne in _recentes(connexion, colonnes)]
+    return {"totaux": totaux, "recentes": recentes}
+
+def exposition(etat):
+    """Texte au format d'exposition Prometheus pour l'état des métriques."""
+    totaux = etat["totaux"]
+    extractions = etat["recentes"]
+    lignes = [
+        "# HELP pvfds_conversions_total Conversions de PV, servies ou non par le cache.",
+        "# TYPE pvfds_conversions_total counter",
+        f'pvfds_conversions_total{{cache="non"}} {totaux.get("conversions", 0) - totaux.get("conversions_cache", 0)}',
+        f'pvfds_conversions_total{{cache="oui"}} {totaux.get("conversions_cache", 0)}',
+        "# HELP pvfds_conversions_erreurs_total Conversions interrompues par une erreur.",
+        "# TYPE pvfds_conversions_erreurs_total counter",
+        f'pvfds_conversions_erreurs_total {totaux.get("erreurs", 0)}',
+        "# HELP pvfds_pages_total Pages examinées, par issue.",
+        "# TYPE pvfds_pages_total counter",
+    ]
+    for statut in STATUTS_PAGE:
+        lignes.append(f'pvfds_pages_total{{statut="{statut}"}} {totaux.get("pages_" + statut, 0)}')
+    lignes += [
+        "# HELP pvfds_etudiants_total Étudiants extraits.",
+        "# TYPE pvfds_etudiants_total counter",
+        f'pvfds_etudiants_total {totaux.get("etudiants", 0)}',
+    ]
+    nombre = totaux.get("extractions", 0)
+    _resume(lignes, "pvfds_conversion_duree_secondes", "Durée d'une conversion hors cache.",
+            [m["duree"] for m in extractions], totaux.get("somme_duree", 0), nombre)
+    _resume(lignes, "pvfds_extraction_duree_secondes", "Durée de l'extraction des pages d'un PV.",
+            [m["duree_extraction"] for m in extractions], totaux.get("somme_duree_extraction", 0), nombre)
+    _resume(lignes, "pvfds_export_duree_secondes", "Durée de l'écriture des deux classeurs.",
+            [m["duree_export"] for m in extractions], totaux.get("somme_duree_export", 0), nombre)
+    _resume(lignes, "pvfds_page_duree_secondes", "Durée de traitement d'une page.",
+            [d for m in extractions for d in m["durees_pages"]], totaux.get("somme_duree_pages", 0),
+            totaux.get("pages_mesurees", 0))
+    lignes += [
+        "# HELP pvfds_derniere_conversion_timestamp_secondes Date de la dernière conversion.",
+        "# TYPE pvfds_derniere_conversion_timestamp_secondes gauge",
+        f'pvfds_derniere_conversion_timestamp_secondes {totaux.get("derniere", 0)}',
+    ]
+    return "\n".join(lignes) + "\n"
+
+def enregistrer_conversion(mesure, dossier=None):
+    """
+    Ajoute l'événement d'une conversion et incrémente les agrégats de son jour dans une même
+    transaction, puis réécrit le fichier d'exposition. Les conversions simultanées (threads ou
+    processus) sont sérialisées par SQLite ; une erreur est signalée sans interrompre la conversion.
+    """
+    dossier = dossier or METRIQUES_DIR
+    date = time.time()
+    pages = mesure["pages"]
+    evenement = {
+        "date": date, "jour": datetime.fromtimestamp(date).strftime("%Y-%m-%d"),
+        "cache": int(mesure["cache"]), "erreur": int(mesure["erreur"]), "pages": sum(pages.values()),
+        **{"pages_" + statut: pages.get(statut, 0) for statut in STATUTS_PAGE},
+        "etudiants": mesure["etudiants"], "duree": mesure["duree"], "duree_extraction": mesure["duree_extraction"],
+        "duree_assemblage": mesure["duree_assemblage"], "duree_export": mesure["duree_export"],
+        "durees_pages": json.dumps([round(d, 4) for d in mesure["durees_pages"]]),
+    }
+    increments = {compteur: evenement.get(compteur, 0) for compteur in COMPTEURS}
+    increments.update(conversions=1 - evenement["erreur"], conversions_cache=evenement["cache"] * (1 - evenement["erreur"]),
+                      erreurs=evenement["erreur"])
+    extraite = int(not evenement["cache"] and not evenement["erreur"])
+    durees_pages = json.loads(evenement["durees_pages"])
+    increments.update(extractions=extraite, somme_duree=extraite * evenement["duree"],
+                      somme_duree_extraction=extraite * evenement["duree_extraction"],
+                      somme_duree_export=extraite * evenement["duree_export"],
+                      pages_mesurees=extraite * len(durees_pages), somme_duree_pages=extraite * sum(durees_pages))
+    try:
+        connexion = _connexion(dossier)
+        try:
+            connexion.execute("BEGIN IMMEDIATE")
+            try:
+                connexion.execute(f"INSERT INTO conversions ({', '.join(evenement)}) "
+                                  f"VALUES ({', '.join('?' * len(evenement))})", list(evenement.values()))
+                connexion.execute(
+                    f"INSERT INTO jours (jour, {', '.join(COMPTEURS)}) VALUES (?{', ?' * len(COMPTEURS)}) "
+                    f"ON CONFLICT (jour) DO UPDATE SET {', '.join(f'{c} = {c} + excluded.{c}' for c in COMPTEURS)}",
+                    [evenement["jour"]] + [increments[c] for c in COMPTEURS])
+                connexion.execute("COMMIT")
+            except BaseException:
+                connexion.execute("ROLLBACK")
+                raise
+            etat = _etat(connexion)
+        finally:
+            connexion.close()
+        _ecrire(os.path.join(dossier, EXPOSITION), exposition(etat))
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ Métriques indisponibles : {e}")
+
+def latences(dossier=None):
+    """(p50, p95) de la durée des conversions hors cache sur la fenêtre glissante, en secondes."""
+    try:
+        connexion = _connexion(dossier or METRIQUES_DIR)
+        try:
+            durees = [duree for duree, in _recentes(connexion, ("duree",))]
+        finally:
+            connexion.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ Métriques indisponibles : {e}")
+        return None, None
+    return quantile(durees, 0.5), quantile(durees, 0.95)
+
+def par_jour(dossier=None):
+    """Conversions réussies par jour, {date: nombre}, lues dans les agrégats quotidiens."""
+    try:
+        connexion = _connexion(dossier or METRIQUES_DIR)
+        try:
+            lignes = connexion.execute("SELECT jour, conversions FROM jours WHERE conversions > 0 ORDER BY jour").fetchall()
+        finally:
+            connexion.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ Métriques indisponibles : {e}")
+        return {}
+    return {datetime.strptime(jour, "%Y-%m-%d"): nombre for jour, nombre in lignes}
+
+def version(dossier=None):
+    """Numéro du dernier événement enregistré : change à chaque conversion, pour invalider les caches."""
+    try:
+        connexion = _connexion(dossier or METRIQUES_DIR)
+        try:
+            return connexion.execute("SELECT MAX(id) FROM conversions").fetchone()[0] or 0
+        finally:
+            connexion.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ Métriques indisponibles : {e}")
+        return None
@@ -0,0 +1,487 @@
+import os
+import json
+import bisect
+import itertools
+import numpy as np
+import pandas as pd
+
+NOM = "Nom\nPrénom"
+MOYENNE = "Moyenne"
+RESULTAT = "Résultat"
+STATUT = " statut"  # suffixe de la colonne de statuts de chaque colonne lue (voir Releve.frame)
+
+# Statuts des cases : indice dans Releve.categories, ou ABSENTE si l'étudiant n'a pas la colonne
+ABSENTE = -1
+NOTE = 0
+
+# Règle de fusion d'une case lue sur plusieurs pages (ou plusieurs fois), par type de colonne :
+# 'premiere' ou 'derniere' lecture, ou 'moyenne' des notes lues (le dernier code si aucune note).
+# Modifiable par PVFDS_FUSION, par exemple PVFDS_FUSION="ue=premiere,moyenne=moyenne".
+REGLES_FUSION = ("premiere", "derniere", "moyenne")
+REGLES = {"ue": "derniere", "moyenne": "derniere", "resultat": "derniere"}
+
+def _regles_env(texte):
+    regles = dict(REGLES)
+    for element in filter(None, texte.split(",")):
+        type_colonne, _, regle = element.strip().partition("=")
+        if type_colonne in REGLES and regle in REGLES_FUSION:
+            regles[type_colonne] = regle
+        else:
+            print(f"⚠ Règle de fusion ignorée : {element!r}")
+    return regles
+
+REGLES = _regles_env(os.environ.get("PVFDS_FUSION", ""))
+
+def type_colonne(nom):
+    """Type d'une colonne pour les règles de fusion : 'moyenne', 'resultat' ou 'ue'."""
+    return {MOYENNE: "moyenne", RESULTAT: "resultat"}.get(nom, "ue")
+
+class Releve:
+    """
+    Étudiants d'une ou plusieurs pages sous forme de colonnes : numéros, noms, puis pour chaque
+    colonne une note float32 (NaN hors note) et un statut, indice dans `categories` dont la
+    première est 'note' et les suivantes les codes lus (AB, NACQ, DIS, ADM, case vide...).
+    Beaucoup plus léger à renvoyer des processus du pool qu'un dictionnaire par étudiant.
+
+    `motifs` garde l'ordre dans lequel les cases de chaque étudiant ont été lues (indices de
+    colonnes), partagé par les étudiants lus de la même façon : il fixe l'ordre des colonnes
+    à la fusion, comme l'ordre des clés des anciens dictionnaires.
+
+    `lectures` compte les notes lues pour chaque case quand une fusion en a fait la moyenne
+    (None : une lecture par note), pour que la moyenne d'une fusion de fusions reste exacte.
+    """
+    __slots__ = ("numeros", "noms", "colonnes", "notes", "codes", "categories", "motifs", "motif", "lectures")
+
+    def __init__(self, numeros, noms, colonnes, notes, codes, categories, motifs, motif, lectures=None):
+        self.numeros = numeros        # liste des numéros d'étudiant
+        self.noms = noms              # liste des « NOM Prénom »
+        self.colonnes = colonnes      # entêtes, chacune une seule fois
+        self.notes = notes            # float32, forme (étudiants, colonnes)
+        self.codes = codes            # int16, même forme
+        self.categories = categories  # ['note', code 1, code 2...]
+        self.motifs = motifs          # tuples d'indices de colonnes, dans l'ordre de lecture
+        self.motif = motif            # indice du motif de chaque étudiant
+        self.lectures = lectures      # int16 comme codes, ou None
+
+    def __len__(self):
+        return len(self.numeros)
+
+    @classmethod
+    def vide(cls):
+        """Relevé d'une page ignorée."""
+        return cls([], [], [], np.empty((0, 0), dtype=np.float32), np.empty((0, 0), dtype=np.int16), ["note"],
+                   [], np.empty(0, dtype=np.intp))
+
+    def reels(self):
+        """Notes en float64, chacune le réel lu dans le PV (voir _decimales), NaN hors note."""
+        return _decimales(self.notes)
+
+    def ecrire(self, dossier):
+        """Enregistre le relevé dans `dossier`, sans pickle : matrices dans releve.npz, listes dans releve.json."""
+        matrices = {"notes": self.notes, "codes": self.codes, "motif": self.motif}
+        if self.lectures is not None:
+            matrices["lectures"] = self.lectures
+        np.savez(os.path.join(dossier, "releve.npz"), **matrices)
+        with open(os.path.join(dossier, "releve.json"), 'w', encoding='utf-8') as f:
+            json.dump({"numeros": self.numeros, "noms": self.noms, "colonnes": self.colonnes,
+                       "categories": self.categories, "motifs": self.motifs}, f, ensure_ascii=False)
+
+    @classmethod
+    def lire(cls, dossier):
+        """Relevé enregistré dans `dossier` par ecrire."""
+        with open(os.path.join(dossier, "releve.json"), 'r', encoding='utf-8') as f:
+            listes = json.load(f)
+        with np.load(os.path.join(dossier, "releve.npz"), allow_pickle=False) as matrices:
+            return cls(listes["numeros"], listes["noms"], listes["colonnes"], matrices["notes"], matrices["codes"],
+                       listes["categories"], [tuple(m) for m in listes["motifs"]], matrices["motif"],
+                       matrices["lectures"] if "lectures" in matrices else None)
+
+    def frame(self):
+        """
+        DataFrame typé des étudiants, indexé par numéro : le nom, puis pour chaque colonne ses
+        notes en float32 (NaN hors note) suivies de « <colonne> statut », catégoriel : 'note' ou
+        le code lu (AB, NACQ, DIS, ADM, "" pour une case vide), NaN si l'étudiant n'a pas la colonne.
+        """
+        donnees = {NOM: self.noms} if self.numeros else {}
+        for j, nom in enumerate(self.colonnes):
+            donnees[nom] = self.notes[:, j]
+            donnees[nom + STATUT] = pd.Categorical.from_codes(self.codes[:, j], self.categories)
+        return pd.DataFrame(donnees, index=pd.Index(self.numeros, dtype=object))
+
+    def dataframe(self):
+        """
+        DataFrame des classeurs (voir convertitPV2.plan_export) : une colonne par entête, notes en
+        réels et codes en texte dans la même colonne.
+        """
+        if not self.numeros:
+            return pd.DataFrame.from_dict({}, orient='index')
+        categories = np.array(self.categories, dtype=object)
+        notes = self.reels()
+        donnees = {NOM: self.noms}
+        for j, nom in enumerate(self.colonnes):
+            codes = self.codes[:, j]
+            textes = codes > NOTE
+            if textes.any():
+                valeurs = notes[:, j].astype(object)
+                valeurs[textes] = categories[codes[textes]]
+            else:
+                valeurs = notes[:, j]
+            donnees[nom] = valeurs
+        return pd.DataFrame(donnees, index=pd.Index(self.numeros, dtype=object))
+
+def _decimales(notes):
+    """
+    Réels (float64) lus dans le PV à partir de leur copie float32 : pour chaque note, le décimal
+    le plus court qui redonne le même float32. Les notes ayant au plus 7 chiffres significatifs,
+    c'est exactement la valeur lue.
+    """
+    reels = notes.astype(np.float64)
+    for decimales in range(9, -1, -1):
+        arrondis = np.round(reels, decimales)
+        reels = np.where(arrondis.astype(np.float32) == notes, arrondis, reels)
+    return reels
+
+# Nombre de cases d'un tableau à partir duquel l'analyse en bloc (analyser_cases) l'emporte sur
+# la lecture case par case : en deçà, le coût fixe des opérations numpy domine
+SEUIL_BLOC = 1000
+
+def _interner(table, valeur):
+    """Indice de `valeur` dans le dictionnaire d'internement `table`, ajoutée si nouvelle."""
+    return table.setdefault(valeur, len(table))
+
+def _commence_par(points, debuts, longueurs, prefixe):
+    """Pour chaque texte (début et longueur dans `points`), vrai s'il commence par `prefixe`."""
+    candidats = np.flatnonzero(longueurs >= len(prefixe))
+    for k, caractere in enumerate(prefixe):
+        candidats = candidats[points[debuts[candidats] + k] == ord(caractere)]
+    ok = np.zeros(len(debuts), dtype=bool)
+    ok[candidats] = True
+    return ok
+
+def _egal(points, debuts, longueurs, mot):
+    """Pour chaque texte (début et longueur dans `points`), vrai s'il vaut `mot`."""
+    return (longueurs == len(mot)) & _commence_par(points, debuts, longueurs, mot)
+
+def _suivant(positions, depuis, fins):
+    """Première des `positions` (triées) à partir de `depuis`, bornée par `fins`."""
+    bornes = np.append(positions, np.iinfo(np.intp).max)
+    return np.minimum(bornes[np.searchsorted(positions, depuis)], fins)
+
+def analyser_cases(textes):
+    """
+    Analyse toutes les cases d'un tableau à la fois. Les textes sont mis bout à bout et leurs
+    retours à la ligne et espaces repérés par numpy ; seuls les mots utiles sont ensuite découpés.
+    Renvoie (resultat, code, notes, textes des codes, textes des résultats) :
+    - resultat : la case commence par « Résultat » (elle donne Moyenne et Résultat) ;
+    - code : la première ligne est un code gardé en texte (AB..., NACQ, DIS ou vide) ;
+    - notes : dernier mot de la première ligne en réel pour les autres cases, NaN sinon ;
+    - textes des codes (cases `code`) et des résultats (premier mot de la deuxième ligne des
+      cases `resultat`), dans l'ordre des cases.
+    Une note illisible ou une case « Résultat » sans deuxième ligne lève la même erreur
+    qu'une lecture case par case.
+    """
+    longueurs = np.fromiter(map(len, textes), dtype=np.intp, count=len(textes))
+    debuts = np.zeros(len(textes), dtype=np.intp)
+    np.cumsum(longueurs[:-1], out=debuts[1:])
+    fins = debuts + longueurs
+    tout = "".join(textes)
+    points = np.frombuffer(tout.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    retours = np.flatnonzero(points == ord("\n"))
+    espaces = np.flatnonzero(points == ord(" "))
+
+    # Première ligne de chaque case, puis son dernier mot (après le dernier espace de la ligne)
+    fins_note = _suivant(retours, debuts, fins)
+    longueurs_note = fins_note - debuts
+    dernier_espace = np.append(-1, espaces)[np.searchsorted(espaces, fins_note)]
+    debuts_mot = np.maximum(dernier_espace + 1, debuts)
+
+    resultat = _commence_par(points, debuts, longueurs, "Résultat")
+    # La première ligne d'une case « Résultat » commence par « Résultat » : la moyenne est chiffrée
+    code = ~resultat & (_commence_par(points, debuts, longueurs_note, "AB") | (longueurs_note == 0)
+                        | _egal(points, debuts, longueurs_note, "NACQ") | _egal(points, debuts, longueurs_note, "DIS"))
+
+    # Case d'une seule ligne sans espace (le cas courant) : le mot est la case entière
+    entiere = longueurs_note == longueurs
+    seule = entiere & (debuts_mot == debuts)
+    notes = np.full(len(textes), np.nan, dtype=np.float32)
+    simples, decoupees = ~code & seule, ~code & ~seule
+    mots = list(itertools.compress(textes, simples))
+    notes[simples] = np.fromiter(map(float, mots), dtype=np.float64, count=len(mots))
+    mots = [tout[a:b] for a, b in zip(debuts_mot[decoupees].tolist(), fins_note[decoupees].tolist())]
+    notes[decoupees] = np.fromiter(map(float, mots), dtype=np.float64, count=len(mots))
+    if entiere[code].all():
+        textes_codes = list(itertools.compress(textes, code))
+    else:
+        textes_codes = [tout[a:b] for a, b in zip(debuts[code].tolist(), fins_note[code].tolist())]
+
+    # Résultat : premier mot de la deuxième ligne
+    if (fins_note[resultat] == fins[resultat]).any():
+        raise IndexError("case Résultat sans deuxième ligne")
+    debuts_ligne = fins_note[resultat] + 1
+    fins_mot = _suivant(espaces, debuts_ligne, _suivant(retours, debuts_ligne, fins[resultat]))
+    textes_resultats = [tout[a:b] for a, b in zip(debuts_ligne.tolist(), fins_mot.tolist())]
+    return resultat, code, notes, textes_codes, textes_resultats
+
+def _lire_tableau_cases(page_data):
+    """Relevé des étudiants d'un tableau extrait, jusqu'à la ligne 'note max', case par case."""
+    entete = page_data[0]
+    etudiants, noms, ordres = {}, [], []
+    colonnes = {}
+    categories = {"note": NOTE}
+    lignes, cols, valeurs, statuts = [], [], [], []  # cases dans l'ordre de lecture
+    cles = [(col, _interner(colonnes, entete[col])) for col in range(1, len(entete)) if entete[col]]
+
+    for ligne in page_data[1:]:
+        if ligne[0].startswith('note max'):
+            break
+        premiere = ligne[0].split("\n")
+        numero = premiere[0].split(":")[1]
+        nom = premiere[1]
+        if numero not in etudiants:
+            etudiants[numero] = len(noms)
+            noms.append(nom)
+            ordres.append([])
+        i = etudiants[numero]
+        lues = []  # colonnes des cases de la ligne, dans l'ordre de lecture
+
+        if len(ligne) > len(entete):
+            raise IndexError("ligne plus longue que l'entête")
+        for col, j in cles:
+            if col < len(ligne):
+                texte = ligne[col]
+                note = texte.split("\n")[0]
+                if not texte.startswith('Résultat'):
+                    if not note.startswith("AB") and note != "" and note != "NACQ" and note != "DIS":
+                        valeurs.append(float(note.split(" ")[-1]))
+                        statuts.append(NOTE)
+                    else:
+                        valeurs.append(np.nan)
+                        statuts.append(_interner(categories, note))
+                    lues.append(j)
+                else:
+                    resultat = texte.split("\n")[1]
+                    if not note.startswith("AB") and note != "":
+                        valeurs.append(float(note.split(" ")[-1]))
+                        statuts.append(NOTE)
+                    else:
+                        valeurs.append(np.nan)
+                        statuts.append(_interner(categories, note))
+                    valeurs.append(np.nan)
+                    statuts.append(_interner(categories, resultat.split(" ")[0]))
+                    lues += (_interner(colonnes, MOYENNE), _interner(colonnes, RESULTAT))
+        lignes += [i] * len(lues)
+        cols += lues
+        ordres[i] += lues
+
+    sequences = [tuple(dict.fromkeys(ordre)) for ordre in ordres]
+    motifs = {}
+    motif = np.array([_interner(motifs, sequence) for sequence in sequences], dtype=np.intp)
+
+    notes = np.full((len(noms), len(colonnes)), np.nan, dtype=np.float32)
+    codes = np.full((len(noms), len(colonnes)), ABSENTE, dtype=np.int16)
+    lignes, cols = np.array(lignes, dtype=np.intp), np.array(cols, dtype=np.intp)
+    valeurs, statuts = np.array(valeurs, dtype=np.float32), np.array(statuts, dtype=np.int16)
+    if len(lignes) != sum(map(len, sequences)):
+        # Une case lue plusieurs fois garde sa dernière lecture
+        _, dernieres = np.unique((lignes * len(colonnes) + cols)[::-1], return_index=True)
+        garder = len(lignes) - 1 - dernieres
+        lignes, cols, valeurs, statuts = lignes[garder], cols[garder], valeurs[garder], statuts[garder]
+    notes[lignes, cols] = valeurs
+    codes[lignes, cols] = statuts
+    return Releve(list(etudiants), noms, list(colonnes), notes, codes, list(categories), list(motifs), motif)
+
+def _lire_tableau_bloc(entete, lignes):
+    """
+    Relevé des lignes d'étudiants d'un grand tableau, cases analysées toutes ensemble (voir
+    analyser_cases) avec les règles de la lecture case par case.
+    """
+    # Étudiants, dans l'ordre des lignes (une même ligne peut revenir)
+    etudiants, noms, rangs = {}, [], []
+    for ligne in lignes:
+        premiere = ligne[0].split("\n")
+        numero = premiere[0].split(":")[1]
+        nom = premiere[1]
+        if numero not in etudiants:
+            etudiants[numero] = len(noms)
+            noms.append(nom)
+        rangs.append(etudiants[numero])
+
+    # Cases sous entête, ligne après ligne : texte, ligne et colonne lue de chacune
+    largeur = max(map(len, lignes), default=0)
+    if largeur > len(entete):
+        raise IndexError("ligne plus longue que l'entête")
+    lues = [col for col in range(1, largeur) if entete[col]]
+    longueurs = [bisect.bisect_left(lues, len(ligne)) for ligne in lignes]
+    if all(len(ligne) == largeur for ligne in lignes):
+        textes = [ligne[col] for ligne in lignes for col in lues]
+        case_col = np.tile(np.arange(len(lues), dtype=np.intp), len(lignes))
+    else:
+        textes = [ligne[col] for ligne in lignes for col in lues if col < len(ligne)]
+        case_col = np.array([c for n in longueurs for c in range(n)], dtype=np.intp)
+    if None in textes:
+        raise TypeError("case vide (None) dans le tableau extrait")
+    case_ligne = np.repeat(np.asarray(rangs, dtype=np.intp), longueurs)
+
+    resultat, code, valeurs, textes_codes, textes_resultats = analyser_cases(textes)
+
+    colonnes = {}
+    indices = np.array([_interner(colonnes, entete[col]) for col in lues], dtype=np.intp)
+    if resultat.any():
+        moyenne, res = _interner(colonnes, MOYENNE), _interner(colonnes, RESULTAT)
+
+    # Statuts : 'note', ou code lu (interné)
+    uniques = dict.fromkeys(textes_codes + textes_resultats)
+    position = {texte: k for k, texte in enumerate(uniques, start=1)}
+    statut_case = np.zeros(len(textes), dtype=np.int16)
+    statut_case[code] = np.fromiter(map(position.__getitem__, textes_codes), dtype=np.int16, count=len(textes_codes))
+    statut_resultat = np.zeros(len(textes), dtype=np.int16)
+    statut_resultat[resultat] = np.fromiter(map(position.__getitem__, textes_resultats), dtype=np.int16,
+                                            count=len(textes_resultats))
+
+    # Une écriture par case, deux pour une case « Résultat » (Moyenne puis Résultat), dans l'ordre de lecture
+    repetitions = 1 + resultat
+    case = np.repeat(np.arange(len(textes)), repetitions)
+    seconde = np.zeros(len(case), dtype=bool)
+    seconde[np.cumsum(repetitions)[resultat] - 1] = True
+    ecrits_lignes = case_ligne[case]
+    ecrits_cols = indices[case_col[case]] if len(lues) else case_col
+    if resultat.any():
+        ecrits_cols[resultat[case]] = np.where(seconde[resultat[case]], res, moyenne)
+    ecrits_valeurs = np.where(seconde, np.float32(np.nan), valeurs[case])
+    ecrits_statuts = np.where(seconde, statut_resultat[case], statut_case[case])
+
+    # Ordre de lecture des cases de chaque étudiant, partagé par les lignes de même forme
+    ordres = [() for _ in noms]
+    formes = {}
+    debut = 0
+    for i, n in zip(rangs, longueurs):
+        cle = (n, resultat[debut:debut + n].tobytes())
+        if cle not in formes:
+            formes[cle] = tuple(dict.fromkeys(
+                j for c in range(n) for j in ((moyenne, res) if resultat[debut + c] else (int(indices[c]),))))
+        ordres[i] += formes[cle]
+        debut += n
+    if len(rangs) == len(noms):
+        sequences = ordres
+    else:
+        sequences = [tuple(dict.fromkeys(ordre)) for ordre in ordres]
+    motifs = {}
+    motif = np.array([_interner(motifs, sequence) for sequence in sequences], dtype=np.intp)
+
+    notes = np.full((len(noms), len(colonnes)), np.nan, dtype=np.float32)
+    codes = np.full((len(noms), len(colonnes)), ABSENTE, dtype=np.int16)
+    if len(case) != sum(map(len, sequences)):
+        # Une case lue plusieurs fois garde sa dernière lecture
+        _, dernieres = np.unique((ecrits_lignes * len(colonnes) + ecrits_cols)[::-1], return_index=True)
+        ecrits = len(case) - 1 - dernieres
+        ecrits_lignes, ecrits_cols = ecrits_lignes[ecrits], ecrits_cols[ecrits]
+        ecrits_valeurs, ecrits_statuts = ecrits_valeurs[ecrits], ecrits_statuts[ecrits]
+    notes[ecrits_lignes, ecrits_cols] = ecrits_valeurs
+    codes[ecrits_lignes, ecrits_cols] = ecrits_statuts
+    return Releve(list(etudiants), noms, list(colonnes), notes, codes, ["note"] + list(uniques),
+                  list(motifs), motif)
+
+def lire_tableau(page_data, seuil=None):
+    """
+    Relevé des étudiants d'un tableau extrait, jusqu'à la ligne 'note max' : première ligne de
+    chaque case, codes AB*, NACQ, DIS ou case vide gardés en texte, sinon dernier mot en réel ;
+    une case « Résultat » donne la Moyenne et le Résultat de l'étudiant. Case par case pour une
+    page courante, en bloc à partir de `seuil` cases (SEUIL_BLOC par défaut : pages longues à
+    nombreuses UE).
+    """
+    lignes = []
+    for ligne in page_data[1:]:
+        if ligne[0].startswith('note max'):
+            break
+        lignes.append(ligne)
+    if sum(map(len, lignes)) < (SEUIL_BLOC if seuil is None else seuil):
+        return _lire_tableau_cases(page_data)
+    return _lire_tableau_bloc(page_data[0], lignes)
+
+def fusionner(releves, regles=None):
+    """
+    Fusionne les relevés des pages, dans l'ordre : étudiants et colonnes dans l'ordre de première
+    apparition. Une case présente sur plusieurs pages suit la règle de son type de colonne
+    (`regles`, REGLES par défaut) ; le nom est celui de la dernière page.
+    Toutes les cases lues sont mises bout à bout puis regroupées par case en une passe.
+    """
+    regles = regles or REGLES
+    releves = [r for r in releves if len(r)]
+    etudiants, colonnes, categories = {}, {}, {"note": NOTE}
+    plans = []
+    for r in releves:
+        lignes = np.array([_interner(etudiants, n) for n in r.numeros], dtype=np.intp)
+        cols = np.array([_interner(colonnes, c) for c in r.colonnes], dtype=np.intp)
+        table = np.array([_interner(categories, c) for c in r.categories], dtype=np.int16)
+        plans.append((r, lignes, cols, table))
+
+    # Cases lues de toutes les pages, dans l'ordre des pages : case de destination, note, statut
+    # et nombre de notes lues
+    noms = np.empty(len(etudiants), dtype=object)
+    apparitions = [[] for _ in range(len(etudiants))]
+    cles, valeurs, statuts, poids = [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=np.float32)], \
+        [np.empty(0, dtype=np.int16)], [np.empty(0, dtype=np.int16)]
+    for p, (r, lignes, cols, table) in enumerate(plans):
+        noms[lignes] = r.noms
+        presentes = r.codes != ABSENTE
+        cles.append((lignes[:, None] * len(colonnes) + cols)[presentes])
+        valeurs.append(r.notes[presentes])
+        statuts.append(table[r.codes[presentes]])
+        poids.append(r.lectures[presentes] if r.lectures is not None else (r.codes[presentes] == NOTE).astype(np.int16))
+        for i, m in zip(lignes.tolist(), r.motif.tolist()):
+            apparitions[i].append((p, m))
+    cles, valeurs, statuts, poids = map(np.concatenate, (cles, valeurs, statuts, poids))
+
+    # Regroupement par case : première et dernière lecture, somme des notes pour les moyennes
+    taille = len(etudiants) * len(colonnes)
+    rang = np.arange(len(cles))
+    derniere = np.full(taille, -1, dtype=np.intp)
+    np.maximum.at(derniere, cles, rang)
+    regle = np.array([regles[type_colonne(c)] for c in colonnes], dtype=object)
+    choix = derniere
+    if (regle == "premiere").any():
+        premiere = np.full(taille, len(cles), dtype=np.intp)
+        np.minimum.at(premiere, cles, rang)
+        choix = np.where(np.tile(regle == "premiere", len(etudiants)), premiere, derniere)
+    # Une case jamais lue prend la lecture fictive ajoutée en fin (NaN, ABSENTE)
+    choix = np.where(derniere < 0, len(cles), choix)
+    notes = np.append(valeurs, np.float32(np.nan))[choix]
+    codes = np.append(statuts, np.int16(ABSENTE))[choix]
+    lectures = None
+    if (regle == "moyenne").any():
+        nombre = np.bincount(cles, weights=poids, minlength=taille)
+        somme = np.bincount(cles, weights=np.where(poids > 0, valeurs.astype(np.float64) * poids, 0),
+                            minlength=taille)
+        moyennes = np.tile(regle == "moyenne", len(etudiants)) & (nombre > 0)
+        notes[moyennes] = somme[moyennes] / nombre[moyennes]
+        codes[moyennes] = NOTE
+        lectures = np.where(moyennes, nombre, codes == NOTE).astype(np.int16).reshape(len(etudiants), len(colonnes))
+    notes = notes.reshape(len(etudiants), len(colonnes))
+    codes = codes.reshape(len(etudiants), len(colonnes))
+
+    # Ordre des colonnes : celui de lecture des cases de chaque étudiant, page après page, les
+    # étudiants pris dans l'ordre ; les étudiants lus de la même façon aux mêmes pages n'ajoutent rien.
+    ordre, signatures, sequences = {}, {}, []
+    motif = np.empty(len(etudiants), dtype=np.intp)
+    for i, pages in enumerate(apparitions):
+        signature = tuple(pages)
+        if signature not in signatures:
+            sequence = {}
+            for p, m in pages:
+                r, _, cols, _ = plans[p]
+                for j in r.motifs[m]:
+                    sequence.setdefault(cols[j])
+                    ordre.setdefault(cols[j])
+            signatures[signature] = len(sequences)
+            sequences.append(sequence)
+        motif[i] = signatures[signature]
+    ordre = list(ordre)
+
+    # Motifs exprimés dans le nouvel ordre des colonnes
+    position = np.empty(len(colonnes), dtype=np.intp)
+    position[ordre] = np.arange(len(ordre))
+    motifs = [tuple(int(position[j]) for j in sequence) for sequence in sequences]
+    noms_colonnes = list(colonnes)
+    return Releve(list(etudiants), noms.tolist(), [noms_colonnes[j] for j in ordre],
+                  notes[:, ordre], codes[:, ordre], list(categories), motifs, motif,
+                  lectures[:, ordre] if lectures is not None else None)
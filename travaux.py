@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import threading
+import collections
+
+# File locale des conversions de l'application, partagée par toutes les sessions du serveur
+TRAVAUX_SIMULTANES = int(os.environ.get("PVFDS_TRAVAUX_SIMULTANES", 2))  # conversions en cours au plus
+ABANDON = float(os.environ.get("PVFDS_TRAVAUX_ABANDON", 120))   # secondes sans suivi avant annulation
+CONSERVATION = 600                                                # secondes de garde d'un travail fini
+
+EN_ATTENTE, EN_COURS, TERMINE, ERREUR, ANNULE = "en_attente", "en_cours", "termine", "erreur", "annule"
+FINIS = (TERMINE, ERREUR, ANNULE)
+
+class Travail:
+    """
+    Une conversion soumise à la file. Sert aussi de file de progression à convertit : put()
+    reçoit (pages traitées, nombre de pages, relevé de la plage) au fil des plages.
+    """
+
+    def __init__(self, demandeur, fonction, args):
+        self.id = uuid.uuid4().hex[:12]
+        self.demandeur = demandeur
+        self.fonction = fonction
+        self.args = args
+        self.statut = EN_ATTENTE
+        self.pages_traitees = 0
+        self.nb_pages = 0
+        self.releves = []
+        self.resultat = None
+        self.erreur = None
+        self.annulation = threading.Event()
+        self.soumis = time.monotonic()
+        self.vu = self.soumis
+        self.fin = None
+
+    def put(self, message):
+        self.pages_traitees, self.nb_pages, releve = message
+        self.releves.append(releve)
+        # Plus personne ne suit ce travail (session fermée) : inutile de continuer
+        if time.monotonic() - self.vu > ABANDON:
+            self.annulation.set()
+
+    @property
+    def fini(self):
+        return self.statut in FINIS
+
+class File:
+    """
+    Ordonnanceur des conversions : au plus `simultanes` à la fois, le demandeur suivant pris à
+    tour de rôle (un demandeur qui soumet beaucoup ne retarde pas les autres), annulation des
+    travaux demandée ou constatée (plus suivis depuis ABANDON secondes).
+    """
+
+    def __init__(self, simultanes=TRAVAUX_SIMULTANES):
+        self._condition = threading.Condition()
+        self._attente = collections.OrderedDict()  # demandeur -> travaux en attente, dans l'ordre
+        self._travaux = {}
+        self._executants = [threading.Thread(target=self._executer, daemon=True) for _ in range(max(simultanes, 1))]
+        for executant in self._executants:
+            executant.start()
+
+    def soumettre(self, demandeur, fonction, *args):
+        """Ajoute fonction(*args, progress_queue=travail, annulation=...) à la file ; renvoie l'identifiant."""
+        travail = Travail(demandeur, fonction, args)
+        with self._condition:
+            self._travaux[travail.id] = travail
+            self._attente.setdefault(demandeur, collections.deque()).append(travail)
+            self._condition.notify()
+        return travail.id
+
+    def suivre(self, identifiant):
+        """Travail d'après son identifiant (None s'il n'existe plus), marqué comme suivi."""
+        with self._condition:
+            travail = self._travaux.get(identifiant)
+            if travail is not None:
+                travail.vu = time.monotonic()
+            return travail
+
+    def position(self, identifiant):
+        """Nombre de travaux qui passeront avant celui-ci (0 s'il n'est plus en attente)."""
+        with self._condition:
+            for rang, travail in enumerate(self._ordre()):
+                if travail.id == identifiant:
+                    return rang
+        return 0
+
+    def annuler(self, identifiant):
+        """Annule un travail en attente, ou demande l'arrêt d'un travail en cours."""
+        with self._condition:
+            travail = self._travaux.get(identifiant)
+            if travail is not None:
+                self._annuler(travail)
+
+    def retirer(self, identifiant):
+        """Oublie un travail dont le résultat a été récupéré (l'annule s'il n'est pas fini)."""
+        with self._condition:
+            travail = self._travaux.pop(identifiant, None)
+            if travail is not None:
+                self._annuler(travail)
+
+    def _annuler(self, travail):
+        travail.annulation.set()
+        if travail.statut == EN_ATTENTE:
+            self._attente[travail.demandeur].remove(travail)
+            if not self._attente[travail.demandeur]:
+                del self._attente[travail.demandeur]
+            travail.statut, travail.fin = ANNULE, time.monotonic()
+
+    def _ordre(self):
+        """Travaux en attente dans l'ordre où ils seront lancés : un par demandeur à tour de rôle."""
+        files = [list(attente) for attente in self._attente.values()]
+        return [f[k] for k in range(max(map(len, files), default=0)) for f in files if k < len(f)]
+
+    def _suivant(self):
+        """Retire le prochain travail : premier demandeur de la rotation, remis en fin s'il en reste."""
+        demandeur, attente = next(iter(self._attente.items()))
+        travail = attente.popleft()
+        del self._attente[demandeur]
+        if attente:
+            self._attente[demandeur] = attente
+        return travail
+
+    def _nettoyer(self):
+        """Annule les travaux plus suivis, oublie les travaux finis depuis CONSERVATION secondes."""
+        maintenant = time.monotonic()
+        for travail in list(self._travaux.values()):
+            if travail.fini:
+                if maintenant - travail.fin > CONSERVATION:
+                    del self._travaux[travail.id]
+            elif maintenant - travail.vu > ABANDON:
+                self._annuler(travail)
+
+    def _executer(self):
+        while True:
+            with self._condition:
+                self._nettoyer()
+                while not self._attente:
+                    self._condition.wait(timeout=10)
+                    self._nettoyer()
+                travail = self._suivant()
+                travail.statut = EN_COURS
+            try:
+                resultat = travail.fonction(*travail.args, progress_queue=travail, annulation=travail.annulation)
+                statut = ANNULE if travail.annulation.is_set() else TERMINE
+            except Exception as e:
+                resultat, statut = None, ANNULE if travail.annulation.is_set() else ERREUR
+                travail.erreur = str(e)
+            with self._condition:
+                travail.resultat, travail.statut, travail.fin = resultat, statut, time.monotonic()
+
+_file = None
+_file_verrou = threading.Lock()
+
+def obtenir_file():
+    """Renvoie la file partagée, en la démarrant au premier appel."""
+    global _file
+    with _file_verrou:
+        if _file is None:
+            _file = File()
+        return _file